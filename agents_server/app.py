@@ -1,12 +1,25 @@
+import asyncio
+import json
+import time
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from firebase_config import *
 from firebase_admin import storage
 import uuid
 import os
-from agents_server.generate_video import orchestrate
+from agents_server.generate_video import orchestrate, job_output_dir, TIMESTAMP_MODE
+from agents_server.checkpoints import read_manifest
+from agents_server.jobs import JobManager, idempotency_key
+from agents_server.clients import close_clients
+from agents_server.concurrency import run_blocking, shutdown_executor
+from agents_server.ffmpeg.transcribe import get_transcription_service
+from agents_server import webhooks
+from agents_server.broll_generation.asset_library import get_asset_library
+from agents_server.progress import report
 
 app = FastAPI()
+app.include_router(webhooks.router)
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,14 +29,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.post("/api/generate")
-async def upload_existing_video(request: Request):
-    try:
-        # Parse JSON payload (just for confirmation/debugging)
-        info = await request.json()
-        print("Received JSON:", info)
 
-        result = await orchestrate(info)
+async def generate_and_upload(info: dict, job_id: str = None) -> dict:
+    """Run the full pipeline for one request and upload the result to Firebase."""
+    try:
+        result = await orchestrate(info, job_id)
         if not result.get("captioned_video"):
             return {
                 "status": False,
@@ -33,14 +43,17 @@ async def upload_existing_video(request: Request):
 
         final_video_path = result["captioned_video"]
 
-        # Step 2: Upload to Firebase Storage
+        # Upload to Firebase Storage
+        started = time.monotonic()
+        report("upload", "started", 0.0)
         bucket = storage.bucket()
         filename = f"generatedVideos/{uuid.uuid4()}.mp4"
         blob = bucket.blob(filename)
-        blob.upload_from_filename(final_video_path)
-        blob.make_public()
+        await run_blocking(blob.upload_from_filename, final_video_path)
+        await run_blocking(blob.make_public)
+        report("upload", "completed", 100.0, seconds=round(time.monotonic() - started, 2))
 
-        # Step 3: Return public URL
+        # Return public URL
         return {
             "status": True,
             "videoUrl": blob.public_url,
@@ -48,3 +61,158 @@ async def upload_existing_video(request: Request):
 
     except Exception as e:
         return {"status": False, "error": str(e)}
+
+
+job_manager = JobManager(generate_and_upload)
+
+
+def _log_warmup_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        # The service has discarded its workers, the first transcription starts them again
+        print(f"⚠️ Whisper warm-up failed: {task.exception()}")
+
+
+@app.on_event("startup")
+async def start_job_workers():
+    await job_manager.start()
+    # Whisper is only a fallback when timestamps come from alignment, load it on first use then
+    if TIMESTAMP_MODE == "whisper":
+        # Load the model in the background so it is warm for the first job
+        app.state.whisper_warmup = asyncio.create_task(run_blocking(get_transcription_service().start))
+        app.state.whisper_warmup.add_done_callback(_log_warmup_failure)
+
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    await job_manager.stop()
+    get_transcription_service().shutdown()
+    shutdown_executor()
+    await close_clients()
+
+
+@app.post("/api/generate")
+async def upload_existing_video(request: Request):
+    try:
+        # Parse JSON payload (just for confirmation/debugging)
+        info = await request.json()
+        print("Received JSON:", info)
+
+        # Client retries of the same request join the existing job instead of starting another
+        key = idempotency_key(info, request.headers.get("Idempotency-Key"))
+        job, duplicate = job_manager.submit_once(info, key)
+        if duplicate and job.status == "completed":
+            return JSONResponse(
+                status_code=200,
+                content={
+                    "status": True,
+                    "jobId": job.id,
+                    "jobStatus": job.status,
+                    "duplicate": True,
+                    "videoUrl": (job.result or {}).get("videoUrl"),
+                },
+            )
+        return JSONResponse(
+            status_code=202,
+            content={
+                "status": True,
+                "jobId": job.id,
+                "jobStatus": job.status,
+                "duplicate": duplicate,
+            },
+        )
+
+    except asyncio.QueueFull:
+        return JSONResponse(
+            status_code=503,
+            content={"status": False, "error": "Too many queued jobs, try again later"},
+        )
+    except Exception as e:
+        return {"status": False, "error": str(e)}
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        return JSONResponse(
+            status_code=404,
+            content={"status": False, "error": f"Unknown job: {job_id}"},
+        )
+    return {"status": True, "job": job.to_dict()}
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    """Stream the job's progress events as Server-Sent Events until the job finishes."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return JSONResponse(
+            status_code=404,
+            content={"status": False, "error": f"Unknown job: {job_id}"},
+        )
+    # EventSource sends the last id it saw when it reconnects
+    last_event_id = request.headers.get("Last-Event-ID", "")
+    after = int(last_event_id) if last_event_id.isdigit() else 0
+
+    async def stream():
+        async for event in job.progress.subscribe(after):
+            if event is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"id: {event['id']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/api/jobs/{job_id}/retry")
+async def retry_job(job_id: str):
+    """Run a failed or interrupted job again, skipping the stages it already finished."""
+    try:
+        payload = None
+        if job_manager.get(job_id) is None:
+            # Not known to this process, e.g. after a restart: take the request from the manifest
+            manifest = await run_blocking(read_manifest, job_output_dir(job_id))
+            payload = manifest.get("payload") if manifest else None
+        job = job_manager.retry(job_id, payload)
+    except asyncio.QueueFull:
+        return JSONResponse(
+            status_code=503,
+            content={"status": False, "error": "Too many queued jobs, try again later"},
+        )
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"status": False, "error": str(e)})
+    if job is None:
+        return JSONResponse(
+            status_code=404,
+            content={"status": False, "error": f"Unknown job: {job_id}"},
+        )
+    if job.status == "completed":
+        # Running it again would upload a new copy and replace the videoUrl the client already has
+        return JSONResponse(
+            status_code=409,
+            content={
+                "status": False,
+                "error": f"Job {job_id} already completed",
+                "jobId": job.id,
+                "jobStatus": job.status,
+                "videoUrl": (job.result or {}).get("videoUrl"),
+            },
+        )
+    return JSONResponse(
+        status_code=202,
+        content={"status": True, "jobId": job.id, "jobStatus": job.status},
+    )
+
+
+@app.get("/api/broll-library/stats")
+async def broll_library_stats():
+    """Lookup statistics of this worker process. The asset count covers the node's whole library."""
+    library = await run_blocking(get_asset_library)
+    if library is None:
+        return {"status": True, "enabled": False}
+    stats = await run_blocking(library.report)
+    return {"status": True, "enabled": True, "scope": "process", "stats": stats}
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import unicodedata
+from typing import Optional
+
+# Set to 0 to always render with HeyGen
+AVATAR_CACHE_ENABLED = os.getenv("AVATAR_CACHE_ENABLED", "1") == "1"
+AVATAR_CACHE_DIR = os.getenv("AVATAR_CACHE_DIR", "/app/output/avatar_cache")
+# Size of the local tier, least recently used videos are evicted beyond it
+AVATAR_CACHE_MAX_BYTES = int(os.getenv("AVATAR_CACHE_MAX_BYTES", str(5 * 1024 ** 3)))
+# Object name prefix in the Firebase storage bucket, the remote tier is off when empty
+AVATAR_CACHE_REMOTE_PREFIX = os.getenv("AVATAR_CACHE_REMOTE_PREFIX", "")
+
+
+def normalize_script(text: str) -> str:
+    """Normalize the script so whitespace and Unicode variants of the same text share a key."""
+    text = unicodedata.normalize("NFKC", text)
+    text = text.replace("“", '"').replace("”", '"').replace("’", "'")
+    return " ".join(text.split())
+
+
+def avatar_cache_key(
+    avatar_id: str,
+    voice_id: str,
+    voice_speed: float,
+    width: int,
+    height: int,
+    script: str,
+    avatar_style: str = "normal"
+) -> str:
+    """Content address of an avatar render: everything HeyGen's output depends on."""
+    script_hash = hashlib.sha256(normalize_script(script).encode("utf-8")).hexdigest()
+    params = {
+        "avatar_id": avatar_id,
+        "avatar_style": avatar_style,
+        "voice_id": voice_id,
+        "voice_speed": round(float(voice_speed), 3),
+        "width": int(width),
+        "height": int(height),
+        "script": script_hash,
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class AvatarCache:
+    """Two-tier store of rendered avatar MP4s: local disk (LRU) and, optionally, the storage bucket.
+
+    Videos are stored under avatar_cache_key. A disk hit refreshes the file's mtime, and
+    the least recently used files are evicted once the disk tier exceeds max_bytes. A
+    bucket hit is copied to disk first, and bucket errors count as a miss.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = AVATAR_CACHE_DIR,
+        max_bytes: int = AVATAR_CACHE_MAX_BYTES,
+        remote_prefix: str = AVATAR_CACHE_REMOTE_PREFIX
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.remote_prefix = remote_prefix
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.mp4")
+
+    def _blob(self, key: str):
+        from firebase_admin import storage
+        return storage.bucket().blob(f"{self.remote_prefix}{key}.mp4")
+
+    def get(self, key: str, output_path: str) -> bool:
+        """Copy the cached video for key to output_path. Returns False on a miss."""
+        path = self._path(key)
+        with self._lock:
+            if os.path.exists(path):
+                # Mark as recently used
+                os.utime(path)
+                shutil.copyfile(path, output_path)
+                print(f"💾 Avatar cache hit (disk): {key[:12]}")
+                return True
+
+        if not self.remote_prefix:
+            return False
+        try:
+            blob = self._blob(key)
+            if not blob.exists():
+                return False
+            tmp_path = f"{path}.download"
+            blob.download_to_filename(tmp_path)
+            with self._lock:
+                os.replace(tmp_path, path)
+            self._evict()
+            shutil.copyfile(path, output_path)
+            print(f"💾 Avatar cache hit (bucket): {key[:12]}")
+            return True
+        except Exception as e:
+            print(f"⚠️ Avatar cache bucket lookup failed: {str(e)}")
+            return False
+
+    def put(self, key: str, video_path: str):
+        """Store a freshly rendered video under key in every tier."""
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        shutil.copyfile(video_path, tmp_path)
+        with self._lock:
+            os.replace(tmp_path, path)
+        self._evict()
+
+        if self.remote_prefix:
+            try:
+                self._blob(key).upload_from_filename(path, content_type="video/mp4")
+            except Exception as e:
+                print(f"⚠️ Avatar cache bucket upload failed: {str(e)}")
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith(".mp4"):
+                    continue
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                os.remove(os.path.join(self.cache_dir, name))
+                total -= size
+                print(f"🧹 Evicted avatar cache entry {name[:12]}")
+
+
+_cache: Optional[AvatarCache] = None
+
+
+def get_avatar_cache() -> Optional[AvatarCache]:
+    """Process-wide avatar cache, or None when AVATAR_CACHE_ENABLED is off."""
+    global _cache
+    if not AVATAR_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        _cache = AvatarCache()
+    return _cache
@@ -0,0 +1,307 @@
+import fcntl
+import json
+import math
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+# Set to 0 to always generate new b-roll
+BROLL_LIBRARY_ENABLED = os.getenv("BROLL_LIBRARY_ENABLED", "1") == "1"
+BROLL_LIBRARY_DIR = os.getenv("BROLL_LIBRARY_DIR", "/app/output/broll_library")
+# Minimum similarity (0-1) for a stored asset to stand in for a new one
+BROLL_LIBRARY_THRESHOLD = float(os.getenv("BROLL_LIBRARY_THRESHOLD", "0.8"))
+# Size of the library on disk, the least used and then oldest assets are evicted beyond it
+BROLL_LIBRARY_MAX_BYTES = int(os.getenv("BROLL_LIBRARY_MAX_BYTES", str(10 * 1024 ** 3)))
+# Share of the score that comes from the static (image) prompt, the rest from the motion prompt
+STATIC_PROMPT_WEIGHT = 0.7
+# Hits kept in memory before they are written to the index without waiting for another change
+USES_FLUSH_EVERY = 20
+
+_STOP_WORDS = {
+    "a", "an", "and", "the", "of", "on", "in", "into", "with", "to", "for", "at", "by", "from",
+    "is", "are", "as", "its", "it", "this", "that", "while", "over", "under", "their", "be",
+}
+
+
+def _tokens(text: str) -> List[str]:
+    words = [word for word in re.findall(r"[a-z0-9]+", text.lower()) if word not in _STOP_WORDS]
+    # Bigrams keep "close up" apart from "up close" and "product desk" apart from "desk product"
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+
+def _tfidf(documents: List[List[str]]) -> List[Dict[str, float]]:
+    """Unit-length TF-IDF vectors for tokenized documents."""
+    count = len(documents)
+    document_frequency = Counter(term for tokens in documents for term in set(tokens))
+    vectors = []
+    for tokens in documents:
+        frequencies = Counter(tokens)
+        vector = {
+            term: (1 + math.log(freq)) * (math.log((1 + count) / (1 + document_frequency[term])) + 1)
+            for term, freq in frequencies.items()
+        }
+        norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+        vectors.append({term: weight / norm for term, weight in vector.items()})
+    return vectors
+
+
+def _cosine(first: Dict[str, float], second: Dict[str, float]) -> float:
+    if len(first) > len(second):
+        first, second = second, first
+    return sum(weight * second.get(term, 0.0) for term, weight in first.items())
+
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class AssetLibrary:
+    """Generated b-roll images and clips, indexed by the prompts that produced them.
+
+    Lookups score every stored asset by TF-IDF cosine similarity of its static and
+    motion prompts. The index file is shared by the worker processes of the node. Each
+    process keeps a parsed copy, reloads it under a shared file lock when the file
+    changes, and scores against it without holding any lock. Changes re-read the file
+    under an exclusive lock, so no worker overwrites assets added by another. Hits are
+    counted in memory and merged into the index with the next change.
+    """
+
+    def __init__(
+        self,
+        directory: str = BROLL_LIBRARY_DIR,
+        threshold: float = BROLL_LIBRARY_THRESHOLD,
+        max_bytes: int = BROLL_LIBRARY_MAX_BYTES
+    ):
+        self.directory = directory
+        self.threshold = threshold
+        self.max_bytes = max_bytes
+        self._index_path = os.path.join(directory, "index.json")
+        self._lock = threading.Lock()
+        self.stats = {"lookups": 0, "hits": 0, "seconds_saved": 0.0, "lookup_seconds": 0.0, "evicted": 0}
+        os.makedirs(directory, exist_ok=True)
+        self._entries: List[Dict[str, Any]] = []
+        self._tokens: List[Tuple[List[str], List[str]]] = []
+        self._version: Optional[Tuple[int, int]] = None
+        # Hits not yet written to the index, by asset id
+        self._pending_uses: Counter = Counter()
+        self._refresh()
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        """Lock the index against other processes. Each call opens its own descriptor, so threads exclude each other too."""
+        with open(f"{self._index_path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _index_version(self) -> Optional[Tuple[int, int]]:
+        """Identifies one write of the index: every write replaces the file, so the inode changes too."""
+        try:
+            stat = os.stat(self._index_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _load(self) -> List[Dict[str, Any]]:
+        if not os.path.exists(self._index_path):
+            return []
+        try:
+            with open(self._index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Ignoring unreadable b-roll library index {self._index_path}: {str(e)}")
+            return []
+
+    def _cache(self, entries: List[Dict[str, Any]], version: Optional[Tuple[int, int]]):
+        """Swap in a new parsed copy of the index, tokenized once per change of the file."""
+        tokens = [(_tokens(e["static_prompt"]), _tokens(e["motion_prompt"])) for e in entries]
+        with self._lock:
+            self._entries, self._tokens, self._version = entries, tokens, version
+
+    def _refresh(self):
+        """Reload the index if it changed since the last load."""
+        version = self._index_version()
+        if version is not None and version == self._version:
+            return
+        with self._file_lock(exclusive=False):
+            version = self._index_version()
+            entries = self._load()
+        self._cache(entries, version)
+
+    def _write(self, add: Optional[Dict[str, Any]] = None, drop: Iterable[str] = ()):
+        """Apply a change to the index as it is on disk now, with the pending hits, and evict beyond max_bytes."""
+        drop = set(drop)
+        with self._file_lock(exclusive=True):
+            with self._lock:
+                pending, self._pending_uses = self._pending_uses, Counter()
+            entries = []
+            for entry in self._load():
+                if entry["id"] in drop:
+                    self._remove_files(entry)
+                    continue
+                entry["uses"] = entry.get("uses", 0) + pending.get(entry["id"], 0)
+                entries.append(entry)
+            if add is not None:
+                entries.append(add)
+            evicted = self._evict(entries, keep=add["id"] if add is not None else None)
+            entries = [entry for entry in entries if entry["id"] not in evicted]
+            tmp_path = f"{self._index_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self._index_path)
+            version = self._index_version()
+        self._cache(entries, version)
+        if evicted:
+            with self._lock:
+                self.stats["evicted"] += len(evicted)
+
+    def _evict(self, entries: List[Dict[str, Any]], keep: Optional[str]) -> Set[str]:
+        """Delete the files of the least used, then oldest, assets until the library fits max_bytes."""
+        for entry in entries:
+            if "bytes" not in entry:
+                entry["bytes"] = _file_size(entry["video_path"]) + _file_size(entry["image_path"])
+        total = sum(entry["bytes"] for entry in entries)
+        evicted = set()
+        for entry in sorted(entries, key=lambda e: (e.get("uses", 0), e.get("created", 0))):
+            if total <= self.max_bytes:
+                break
+            # Never evict the asset that is being added
+            if entry["id"] == keep:
+                continue
+            self._remove_files(entry)
+            evicted.add(entry["id"])
+            total -= entry["bytes"]
+            print(f"🧹 Evicted b-roll asset {entry['id'][:12]} ({entry.get('uses', 0)} uses)")
+        return evicted
+
+    def _remove_files(self, entry: Dict[str, Any]):
+        for path in (entry["video_path"], entry["image_path"]):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _scores(self, static_prompt: str, motion_prompt: str, tokens: List[Tuple[List[str], List[str]]]) -> List[float]:
+        static_vectors = _tfidf([_tokens(static_prompt)] + [static for static, _ in tokens])
+        motion_vectors = _tfidf([_tokens(motion_prompt)] + [motion for _, motion in tokens])
+        return [
+            STATIC_PROMPT_WEIGHT * _cosine(static_vectors[0], static_vectors[i])
+            + (1 - STATIC_PROMPT_WEIGHT) * _cosine(motion_vectors[0], motion_vectors[i])
+            for i in range(1, len(static_vectors))
+        ]
+
+    def find(self, static_prompt: str, motion_prompt: str) -> Optional[Dict[str, Any]]:
+        """Return the most similar stored asset at or above the threshold, or None.
+
+        Candidates are tried in score order, and entries whose clip is gone are dropped
+        from the index.
+        """
+        started = time.monotonic()
+        self._refresh()
+        with self._lock:
+            entries, tokens = self._entries, self._tokens
+
+        best = None
+        missing = []
+        if entries:
+            scores = self._scores(static_prompt, motion_prompt, tokens)
+            for index in sorted(range(len(scores)), key=scores.__getitem__, reverse=True):
+                if scores[index] < self.threshold:
+                    break
+                entry = entries[index]
+                if not os.path.exists(entry["video_path"]):
+                    missing.append(entry["id"])
+                    continue
+                best = dict(entry, score=round(scores[index], 3))
+                break
+
+        with self._lock:
+            self.stats["lookups"] += 1
+            self.stats["lookup_seconds"] += time.monotonic() - started
+            if best:
+                self.stats["hits"] += 1
+                self.stats["seconds_saved"] += best.get("generation_seconds", 0.0)
+                self._pending_uses[best["id"]] += 1
+            flush = sum(self._pending_uses.values()) >= USES_FLUSH_EVERY
+        if missing:
+            print(f"🧹 Dropping {len(missing)} b-roll assets whose clips are gone")
+        if missing or flush:
+            self._write(drop=missing)
+        return best
+
+    def add(
+        self,
+        static_prompt: str,
+        motion_prompt: str,
+        image_bytes: bytes,
+        video_path: str,
+        generation_seconds: float
+    ) -> Dict[str, Any]:
+        """Copy a freshly generated image and clip into the library."""
+        asset_id = uuid.uuid4().hex
+        stored_video = os.path.join(self.directory, f"{asset_id}.mp4")
+        stored_image = os.path.join(self.directory, f"{asset_id}.img")
+        shutil.copyfile(video_path, stored_video)
+        with open(stored_image, "wb") as f:
+            f.write(image_bytes)
+        entry = {
+            "id": asset_id,
+            "static_prompt": static_prompt,
+            "motion_prompt": motion_prompt,
+            "image_path": stored_image,
+            "video_path": stored_video,
+            "bytes": _file_size(stored_video) + len(image_bytes),
+            "generation_seconds": round(generation_seconds, 1),
+            "created": time.time(),
+            "uses": 0,
+        }
+        self._write(add=entry)
+        return entry
+
+    def use(self, entry: Dict[str, Any], output_path: str) -> Optional[str]:
+        """Copy a stored clip to output_path. Returns None if the clip was evicted in the meantime."""
+        try:
+            shutil.copyfile(entry["video_path"], output_path)
+        except FileNotFoundError:
+            return None
+        return output_path
+
+    def report(self) -> Dict[str, Any]:
+        """Statistics of this process, the asset count is the node's."""
+        with self._lock:
+            lookups = self.stats["lookups"]
+            return {
+                "assets": len(self._entries),
+                "lookups": lookups,
+                "hits": self.stats["hits"],
+                "hitRate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+                "secondsSaved": round(self.stats["seconds_saved"], 1),
+                "averageLookupMs": round(self.stats["lookup_seconds"] / lookups * 1000, 2) if lookups else 0.0,
+                "evicted": self.stats["evicted"],
+            }
+
+
+_library: Optional[AssetLibrary] = None
+_library_lock = threading.Lock()
+
+
+def get_asset_library() -> Optional[AssetLibrary]:
+    """Process-wide asset library, or None when BROLL_LIBRARY_ENABLED is off."""
+    global _library
+    if not BROLL_LIBRARY_ENABLED:
+        return None
+    with _library_lock:
+        if _library is None:
+            _library = AssetLibrary()
+        return _library
@@ -1,11 +1,16 @@
-from openai import OpenAI
 from .runway import generate_video_from_image
 from .broll_image import generate_broll_image
-from typing import Dict, Any, List
+from .asset_library import get_asset_library
+from agents_server.concurrency import run_blocking, provider_limit
+from agents_server.clients import get_openai_client
+from agents_server.llm_cache import cached_call
+from pydantic import BaseModel
+from typing import Dict, Any, List, Tuple
+import asyncio
 import os
-import base64
+import time
 
-client = OpenAI()
+client = get_openai_client()
 
 # Runway prompt keywords
 RUNWAY_CAMERA_STYLES = [
@@ -45,16 +50,20 @@ def convert_to_static_prompt(dynamic_description: str) -> str:
     Respond with just the static image description, no additional text.
     """
 
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": "You are a professional photographer and art director. Convert dynamic video descriptions into compelling static image prompts."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.7
-    )
+    messages = [
+        {"role": "system", "content": "You are a professional photographer and art director. Convert dynamic video descriptions into compelling static image prompts."},
+        {"role": "user", "content": prompt}
+    ]
 
-    return response.choices[0].message.content.strip()
+    def complete():
+        response = client.chat.completions.create(
+            model="gpt-4",
+            messages=messages,
+            temperature=0.7
+        )
+        return response.choices[0].message.content.strip()
+
+    return cached_call("static_prompt", "gpt-4", messages, complete, temperature=0.7)
 
 def convert_to_runway_prompt(dynamic_description: str) -> str:
     """Convert a dynamic video description into a Runway-compliant motion prompt"""
@@ -74,49 +83,142 @@ def convert_to_runway_prompt(dynamic_description: str) -> str:
     Respond with just the motion prompt, no additional text. Prompt should be purely descriptive, not conversational.
     """
 
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": "You are a professional cinematographer. Create concise motion prompts focusing on camera movement, lighting, and motion effects."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.7
-    )
+    messages = [
+        {"role": "system", "content": "You are a professional cinematographer. Create concise motion prompts focusing on camera movement, lighting, and motion effects."},
+        {"role": "user", "content": prompt}
+    ]
+
+    def complete():
+        response = client.chat.completions.create(
+            model="gpt-4",
+            messages=messages,
+            temperature=0.7
+        )
+        return response.choices[0].message.content.strip()
+
+    return cached_call("runway_prompt", "gpt-4", messages, complete, temperature=0.7)
 
-    return response.choices[0].message.content.strip()
+class ScenePrompts(BaseModel):
+    static_prompt: str
+    motion_prompt: str
 
-def generate_broll_scene(dynamic_description: str, output_path: str) -> Dict[str, Any]:
+def convert_to_scene_prompts(dynamic_description: str) -> ScenePrompts:
+    """Derive both the DALL-E image prompt and the Runway motion prompt in a single structured call"""
+    prompt = f"""
+    Convert this dynamic video scene description into two prompts.
+
+    static_prompt: a static image prompt that captures the most impactful moment.
+    Focus on describing a single frame that best represents the scene, including details about composition, lighting, and focus.
+    Make it suitable for DALL-E image generation.
+
+    motion_prompt: a Runway-compliant motion prompt.
+    Focus on describing the motion and cinematography, not the contents of the image.
+    Use appropriate keywords from these categories (only when relevant):
+    - Camera styles: {', '.join(RUNWAY_CAMERA_STYLES)}
+    - Lighting: {', '.join(RUNWAY_LIGHTING)}
+    - Movement speeds: {', '.join(RUNWAY_MOVEMENT_SPEEDS)}
+    - Movement types: {', '.join(RUNWAY_MOVEMENT_TYPES)}
+    - Style and aesthetic: {', '.join(RUNWAY_STYLES)}
+    The motion prompt should be purely descriptive, not conversational.
+
+    Video description:
+    {dynamic_description}
+    """
+
+    messages = [
+        {"role": "system", "content": "You are a professional photographer, art director and cinematographer. Convert dynamic video descriptions into compelling static image prompts and concise motion prompts focusing on camera movement, lighting, and motion effects."},
+        {"role": "user", "content": prompt}
+    ]
+
+    def complete():
+        response = client.beta.chat.completions.parse(
+            model="gpt-4o",
+            messages=messages,
+            response_format=ScenePrompts,
+            temperature=0.7
+        )
+        prompts = response.choices[0].message.parsed
+        return ScenePrompts(
+            static_prompt=prompts.static_prompt.strip(),
+            motion_prompt=prompts.motion_prompt.strip()
+        )
+
+    return cached_call("scene_prompts", "gpt-4o", messages, complete, schema=ScenePrompts, temperature=0.7)
+
+async def _limited_completion(func, dynamic_description: str) -> str:
+    async with provider_limit("openai"):
+        return await run_blocking(func, dynamic_description)
+
+async def derive_scene_prompts(dynamic_description: str) -> Tuple[str, str]:
+    """Return (static_description, motion_prompt) for a scene, falling back to two concurrent calls"""
+    try:
+        prompts = await _limited_completion(convert_to_scene_prompts, dynamic_description)
+        return prompts.static_prompt, prompts.motion_prompt
+    except Exception as e:
+        print(f"⚠️ Combined prompt derivation failed, using separate prompts: {str(e)}")
+        static_description, motion_prompt = await asyncio.gather(
+            _limited_completion(convert_to_static_prompt, dynamic_description),
+            _limited_completion(convert_to_runway_prompt, dynamic_description)
+        )
+        return static_description, motion_prompt
+
+async def generate_broll_scene(dynamic_description: str, output_path: str) -> Dict[str, Any]:
     """Generate both an image and video for a b-roll scene from a dynamic description"""
     try:
         # Convert descriptions for both image and video
-        static_description = convert_to_static_prompt(dynamic_description)
-        motion_prompt = convert_to_runway_prompt(dynamic_description)
+        static_description, motion_prompt = await derive_scene_prompts(dynamic_description)
         
         print(f"\n🎨 Generated static prompt: {static_description}")
         print(f"\n🎥 Generated motion prompt: {motion_prompt}")
-        
+
+        # Reuse a stored scene if one was generated from near-identical prompts
+        library = get_asset_library()
+        if library is not None:
+            asset = await run_blocking(library.find, static_description, motion_prompt)
+            # The clip may have been evicted by another worker since the lookup
+            if asset is not None and await run_blocking(library.use, asset, output_path):
+                print(f"♻️ Reusing b-roll asset {asset['id'][:12]} (similarity {asset['score']}, saves ~{asset['generation_seconds']}s)")
+                return {
+                    'success': True,
+                    'motion_prompt': motion_prompt,
+                    'static_description': static_description,
+                    'video_path': output_path,
+                    'reused_asset': asset['id']
+                }
+
+        started = time.monotonic()
         # Generate the image in portrait mode
-        image_b64 = generate_broll_image(
-            scene_description=static_description,
-            scene_type="product",
-            quality="hd",
-            size="1024x1792"  # Portrait 9:16 ratio
-        )
+        async with provider_limit("dalle"):
+            image_bytes = await run_blocking(
+                generate_broll_image,
+                scene_description=static_description,
+                scene_type="product",
+                quality="hd",
+                size="1024x1792"  # Portrait 9:16 ratio
+            )
         
         # Generate the video using the Runway-compliant prompt
-        video_path = generate_video_from_image(
-            image_base64=image_b64,
-            output_path=output_path,
-            prompt_text=motion_prompt,
-            ratio='720:1280'  # Portrait 9:16 ratio (720p)
-        )
+        async with provider_limit("runway"):
+            video_path = await generate_video_from_image(
+                image_bytes=image_bytes,
+                output_path=output_path,
+                prompt_text=motion_prompt,
+                ratio='720:1280'  # Portrait 9:16 ratio (720p)
+            )
+
+        if library is not None:
+            try:
+                await run_blocking(
+                    library.add, static_description, motion_prompt, image_bytes, video_path, time.monotonic() - started
+                )
+            except Exception as e:
+                print(f"⚠️ Could not store b-roll asset: {str(e)}")
         
         return {
             'success': True,
             'motion_prompt': motion_prompt,
             'static_description': static_description,
-            'video_path': video_path,
-            'image_base64': image_b64
+            'video_path': video_path
         }
         
     except Exception as e:
@@ -125,21 +227,22 @@ def generate_broll_scene(dynamic_description: str, output_path: str) -> Dict[str
             'error': str(e)
         }
 
-def generate_broll_for_product(dynamic_description: str, product_image_b64: str, output_path: str) -> Dict[str, Any]:
+async def generate_broll_for_product(dynamic_description: str, product_image: bytes, output_path: str) -> Dict[str, Any]:
     """Generate a video for a product from a dynamic description"""
     try:
         # Convert descriptions for both image and video
-        motion_prompt = convert_to_runway_prompt(dynamic_description)
+        motion_prompt = await _limited_completion(convert_to_runway_prompt, dynamic_description)
         
         print(f"\n Generated motion prompt: {motion_prompt}")
         
         # Generate the video using the Runway-compliant prompt
-        video_path = generate_video_from_image(
-            image_base64=product_image_b64,
-            output_path=output_path,
-            prompt_text=motion_prompt,
-            ratio='720:1280'  # Portrait 9:16 ratio (720p)
-        )
+        async with provider_limit("runway"):
+            video_path = await generate_video_from_image(
+                image_bytes=product_image,
+                output_path=output_path,
+                prompt_text=motion_prompt,
+                ratio='720:1280'  # Portrait 9:16 ratio (720p)
+            )
         
         return {
             'success': True,
@@ -160,20 +263,14 @@ if __name__ == "__main__":
     # Ensure output directory exists
     os.makedirs('output', exist_ok=True)
     
-    result = generate_broll_scene(
+    result = asyncio.run(generate_broll_scene(
         dynamic_description=dynamic_description,
         output_path="output/bottle_cap.mp4"
-    )
+    ))
     
     if result['success']:
         print(f"\n✨ Generated video saved to: {result['video_path']}")
         print(f"\n📝 Static description: {result['static_description']}")
         print(f"\n🎥 Motion prompt: {result['motion_prompt']}")
-        
-        # Save the image too
-        img_data = base64.b64decode(result['image_base64'])
-        with open('output/bottle_cap.png', 'wb') as f:
-            f.write(img_data)
-        print(f"\n📁 Saved image to: output/bottle_cap.png")
     else:
         print(f"\n❌ Error: {result['error']}")
@@ -1,9 +1,8 @@
 import os
 import base64
-from openai import OpenAI
 from dotenv import load_dotenv
 from typing import Optional
-import requests
+from agents_server.clients import get_openai_client
 
 # Load environment variables
 load_dotenv()
@@ -11,7 +10,7 @@ load_dotenv()
 class BrollImageGenerator:
     def __init__(self):
         """Initialize the BrollImageGenerator with OpenAI client"""
-        self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        self.client = get_openai_client()
         self.default_style_keywords = [
             "photorealistic",
             "high detail",
@@ -32,8 +31,8 @@ class BrollImageGenerator:
             style_keywords: Optional[list] = None,
             size: str = "1024x1024",
             quality: str = "hd"
-        ) -> str:
-        """Generate a realistic image using DALL-E 3 and return base64 string"""
+        ) -> bytes:
+        """Generate a realistic image using DALL-E 3 and return the encoded image bytes"""
 
         prompt = self._construct_prompt(scene_description, style_keywords)
         print(f"\nGenerating image with prompt: {prompt}")
@@ -45,18 +44,12 @@ class BrollImageGenerator:
                 prompt=f"{prompt}. Compose this as a vertical/portrait shot with 9:16 aspect ratio.",
                 size=size,
                 quality=quality,
+                response_format="b64_json",
                 n=1
             )
 
-            # Get the image URL
-            image_url = response.data[0].url
-
-            # Download the image
-            img_data = requests.get(image_url).content
-
-            # Encode to base64
-            b64_img = base64.b64encode(img_data).decode('utf-8')
-            return b64_img
+            # The image comes back inline, no second download
+            return base64.b64decode(response.data[0].b64_json)
 
         except Exception as e:
             raise Exception(f"Error generating image: {str(e)}")
@@ -67,12 +60,8 @@ def generate_broll_image(
     scene_type: str = "product",  # product, lifestyle, environment
     size: str = "1024x1792",  # Portrait 9:16 ratio (1024x1792)
     **kwargs
-) -> str:
+) -> bytes:
     """Convenience function to generate a b-roll image"""
-    generator = BrollImageGenerator()
-    
-    # No need for file operations since we're just returning the URL
-    
     # Add scene-specific style keywords
     style_keywords = kwargs.pop('style_keywords', [])
     if scene_type == "product":
@@ -120,16 +109,15 @@ if __name__ == "__main__":
     static_description = "A sleek stainless steel water bottle cap with a soft blue UV light glowing from within, captured in a dramatic close-up against a dark background. The cap's modern design and the ethereal blue glow create a high-tech, premium aesthetic."
     try:
         # Example with a static image description
-        b64_data = generate_broll_image(
+        img_data = generate_broll_image(
             scene_description=static_description,
             scene_type="product",
             quality="hd",
             size="1024x1792"  # Portrait 9:16 ratio
         )
-        print(f"\n✨ Generated base64 image data (first 50 chars): {b64_data[:50]}...")
+        print(f"\n✨ Generated image ({len(img_data)} bytes)")
         
         # Save the image
-        img_data = base64.b64decode(b64_data)
         with open('test_output.png', 'wb') as f:
             f.write(img_data)
         print(f"📁 Saved test image to: test_output.png")
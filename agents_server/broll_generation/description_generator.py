@@ -1,8 +1,16 @@
+import os
+import numpy as np
 from pydantic import BaseModel
-from openai import OpenAI
 from typing import List
+from agents_server.clients import get_openai_client
+from agents_server.llm_cache import cached_call
 
-client = OpenAI()
+client = get_openai_client()
+
+# "single" plans every B-roll in one structured call, "iterative" uses one call per B-roll
+BROLL_PLANNER_MODE = os.getenv("BROLL_PLANNER_MODE", "single")
+# Number of B-rolls planned in addition to the product movement scene
+MAX_BROLL_SCENES = int(os.getenv("MAX_BROLL_SCENES", "2"))
 
 class BrollDescription(BaseModel):
     start: float
@@ -15,26 +23,37 @@ class BrollDescription(BaseModel):
 class BrollCount(BaseModel):
     count: int
 
+class BrollWindow(BaseModel):
+    start: float
+    end: float
+    description: str
+
+class BrollPlan(BaseModel):
+    product_movement: BrollWindow
+    scenes: List[BrollWindow]
+
 def estimate_broll_count(transcript):
     prompt = f"""
 Transcript:
-{transcript}
+{format_transcript(transcript)}
 
 How many B-roll scenes should be inserted in this video? Please respond with just an integer.
 """
-    response = client.beta.chat.completions.parse(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": "Decide how many B-rolls are necessary for the given transcript. Respond with just an integer. Integer should ideally be less than or equal to 3, unless you feel like it is necessary to have more"},
-            {"role": "user", "content": prompt},
-        ],
-        response_format=BrollCount
-    )
+    messages = [
+        {"role": "system", "content": "Decide how many B-rolls are necessary for the given transcript. Respond with just an integer. Integer should ideally be less than or equal to 3, unless you feel like it is necessary to have more"},
+        {"role": "user", "content": prompt},
+    ]
 
-    # Parse the response as JSON and extract the count
-    import json
-    result = json.loads(response.choices[0].message.content)
-    return result.get('count', 3)  # Default to 3 if parsing fails
+    def complete():
+        response = client.beta.chat.completions.parse(
+            model="gpt-4o",
+            messages=messages,
+            response_format=BrollCount
+        )
+        return response.choices[0].message.parsed
+
+    result = cached_call("broll_count", "gpt-4o", messages, complete, schema=BrollCount)
+    return result.count if result is not None else 3  # Default to 3 if parsing fails
 
 def generate_single_broll(transcript, history: List[BrollDescription]):
     # Ensure history is a list
@@ -50,7 +69,7 @@ def generate_single_broll(transcript, history: List[BrollDescription]):
 
     prompt = f"""
 Transcript:
-{transcript}
+{format_transcript(transcript)}
 
 Selected B-rolls so far:
 {history_text}
@@ -59,53 +78,185 @@ Now choose one more B-roll scene (that doesn't overlap with the above), and desc
 You may also choose a broll that runs over multiple segment, just make sure you specified the start and end time.
 """
 
-    response = client.beta.chat.completions.parse(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": "You are a video editor's assistant. Choose and describe one new B-roll scene for the transcript, just keep the scene simple Respond with a JSON object containing 'start' (float), 'end' (float), and 'description' (string)."},
-            {"role": "user", "content": prompt},
-        ],
-        response_format=BrollDescription
-    )
+    messages = [
+        {"role": "system", "content": "You are a video editor's assistant. Choose and describe one new B-roll scene for the transcript, just keep the scene simple Respond with a JSON object containing 'start' (float), 'end' (float), and 'description' (string)."},
+        {"role": "user", "content": prompt},
+    ]
 
-    # Parse the response as JSON and return as a BrollDescription instance
-    import json
-    result = json.loads(response.choices[0].message.content)
-    return BrollDescription(**result)
+    def complete():
+        response = client.beta.chat.completions.parse(
+            model="gpt-4o",
+            messages=messages,
+            response_format=BrollDescription
+        )
+        return response.choices[0].message.parsed
+
+    return cached_call("broll_single", "gpt-4o", messages, complete, schema=BrollDescription)
 
 def generate_product_movement(transcript):
     prompt = f"""
         Transcript:
-        {transcript}
+        {format_transcript(transcript)}
         
         Now choose one timestamp where the product should be shown in motion. You may use simple movement like zoom in, rotate, pan, or fade. 
         You can also combine movements if it makes sense, but keep it simple and relevant to the transcript.
     """
 
-    response = client.beta.chat.completions.parse(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": "You are a video editor's assistant. Choose and describe one new B-roll scene for the transcript, just keep the scene simple Respond with a JSON object containing 'start' (float), 'end' (float), and 'description' (string)."},
-            {"role": "user", "content": prompt},
-        ],
-        response_format=BrollDescription
-    )
-    import json
-    result = json.loads(response.choices[0].message.content)
-    return BrollDescription(**result)
+    messages = [
+        {"role": "system", "content": "You are a video editor's assistant. Choose and describe one new B-roll scene for the transcript, just keep the scene simple Respond with a JSON object containing 'start' (float), 'end' (float), and 'description' (string)."},
+        {"role": "user", "content": prompt},
+    ]
+
+    def complete():
+        response = client.beta.chat.completions.parse(
+            model="gpt-4o",
+            messages=messages,
+            response_format=BrollDescription
+        )
+        return response.choices[0].message.parsed
+    return cached_call("product_movement", "gpt-4o", messages, complete, schema=BrollDescription)
     
 
-def generate_all_brolls(transcript) -> List[BrollDescription]:
+def format_transcript(transcript) -> str:
+    """Encode a transcript as one compact "start-end text" line per segment."""
+    if isinstance(transcript, str):
+        return transcript.strip()
+    return "\n".join(
+        f"{segment['start']:.2f}-{segment['end']:.2f} {segment['text']}"
+        for segment in transcript
+    )
+
+def transcript_duration(transcript) -> float:
+    if isinstance(transcript, str) or not transcript:
+        return None
+    return max(segment['end'] for segment in transcript)
+
+def validate_broll_windows(windows: List[BrollDescription], duration: float = None) -> List[BrollDescription]:
+    """
+    Keep the windows that lie within the transcript and do not overlap an earlier one.
+    Windows are checked in priority order, so the product movement scene should come first.
+    """
+    accepted: List[BrollDescription] = []
+    for window in windows:
+        start = max(0.0, window.start)
+        end = min(window.end, duration) if duration is not None else window.end
+        if end <= start:
+            print(f"⚠️ Dropping B-roll outside of the transcript: {window.start:.2f}s to {window.end:.2f}s")
+            continue
+        if any(start < other.end and other.start < end for other in accepted):
+            print(f"⚠️ Dropping overlapping B-roll: {window.start:.2f}s to {window.end:.2f}s")
+            continue
+        window.start = start
+        window.end = end
+        accepted.append(window)
+    return accepted
+
+def snap_broll_windows(
+    brolls: List[BrollDescription],
+    estimated_transcript,
+    transcript,
+    max_drift: float
+) -> List[BrollDescription]:
+    """
+    Move B-roll windows planned on estimated timings onto the real transcript.
+
+    When both transcripts have the same segments, every boundary is mapped piecewise
+    linearly between them, so a window keeps covering the same words. Otherwise the
+    windows are scaled by the ratio of the durations, which is only trusted while it
+    stays within max_drift.
+
+    Returns:
+        The moved windows, or None if the plan should be redone on the real transcript
+    """
+    estimated_duration = transcript_duration(estimated_transcript)
+    duration = transcript_duration(transcript)
+    if not brolls or not estimated_duration or not duration:
+        return None
+
+    if len(estimated_transcript) == len(transcript):
+        estimated_points = [segment['start'] for segment in estimated_transcript] + [estimated_duration]
+        points = [segment['start'] for segment in transcript] + [duration]
+        # Keep the points increasing for interpolation
+        estimated_points = np.maximum.accumulate(estimated_points)
+        def move(t):
+            return float(np.interp(t, estimated_points, points))
+    else:
+        ratio = duration / estimated_duration
+        if abs(ratio - 1) > max_drift:
+            print(f"⚠️ Speech length is {ratio:.2f}x the estimate, re-planning B-roll")
+            return None
+        def move(t):
+            return t * ratio
+
+    moved = [
+        broll.model_copy(update={'start': round(move(broll.start), 2), 'end': round(move(broll.end), 2)})
+        for broll in brolls
+    ]
+    snapped = validate_broll_windows(moved, duration)
+    if len(snapped) < len(moved):
+        print(f"⚠️ {len(moved) - len(snapped)} speculative B-roll windows did not fit the real transcript")
+    return snapped or None
+
+def plan_all_brolls(transcript) -> List[BrollDescription]:
+    """Plan the product movement scene and every other B-roll in a single structured call"""
+    prompt = f"""
+Transcript (one segment per line, "start-end text", times in seconds):
+{format_transcript(transcript)}
+
+Plan the B-roll scenes for this video:
+- product_movement: one segment where the product should be shown in motion. You may use simple movement like zoom in, rotate, pan, or fade.
+- scenes: up to {MAX_BROLL_SCENES} other B-roll scenes, only as many as the video needs. Describe what should be shown, just keep it simple.
+A B-roll may run over multiple segments. B-rolls must not overlap each other and must stay within the transcript.
+"""
+
+    messages = [
+        {"role": "system", "content": "You are a video editor's assistant. Choose and describe the B-roll scenes for the transcript, just keep each scene simple. Every scene has a 'start' (float), 'end' (float), and 'description' (string)."},
+        {"role": "user", "content": prompt},
+    ]
+
+    def complete():
+        response = client.beta.chat.completions.parse(
+            model="gpt-4o",
+            messages=messages,
+            response_format=BrollPlan
+        )
+        return response.choices[0].message.parsed
+
+    plan = cached_call("broll_plan", "gpt-4o", messages, complete, schema=BrollPlan)
+    windows = [BrollDescription(**plan.product_movement.model_dump())]
+    windows += [BrollDescription(**scene.model_dump()) for scene in plan.scenes[:MAX_BROLL_SCENES]]
+    brolls = validate_broll_windows(windows, transcript_duration(transcript))
+    if not brolls or brolls[0] is not windows[0]:
+        raise ValueError("B-roll plan has no valid product movement scene")
+
+    # Product movement first, the others in timeline order
+    return brolls[:1] + sorted(brolls[1:], key=lambda b: b.start)
+
+def generate_all_brolls_iterative(transcript) -> List[BrollDescription]:
     count = estimate_broll_count(transcript)
     brolls: List[BrollDescription] = []
     first_broll = generate_product_movement(transcript)
+    # A refused or unparsable answer comes back as None
+    if first_broll is None:
+        raise ValueError("B-roll planning returned no product movement scene")
     brolls.append(first_broll)
-    for _ in range(min(2, count)):
+    for index in range(min(MAX_BROLL_SCENES, count)):
         new_broll = generate_single_broll(transcript, brolls)
+        if new_broll is None:
+            print(f"⚠️ Skipping B-roll {index + 1}: the model returned no scene")
+            continue
         brolls.append(new_broll)
 
     return brolls
 
+def generate_all_brolls(transcript) -> List[BrollDescription]:
+    if BROLL_PLANNER_MODE == "single":
+        try:
+            return plan_all_brolls(transcript)
+        except Exception as e:
+            print(f"⚠️ Single-call B-roll planning failed, falling back to iterative planning: {str(e)}")
+    return generate_all_brolls_iterative(transcript)
+
 if __name__ == "__main__":
     transcript = """
         [{'start': 0.0, 'end': 3.28, 'text': 'Tired of worrying about hydration and hygiene on the go?'}, 
@@ -1,29 +1,56 @@
+import asyncio
 import os
-import time
 import base64
 import requests
 from typing import Optional, Dict, Any
 from pathlib import Path
-from runwayml import RunwayML
 from dotenv import load_dotenv
-from PIL import Image
+from agents_server.clients import get_runway_client
+from agents_server.concurrency import run_blocking
+from agents_server.downloads import download_file
+from agents_server.polling import poll_until
+from PIL import Image, ImageOps
 from io import BytesIO
 
 load_dotenv()
 
+# JPEG quality of the prompt image sent to Runway
+RUNWAY_IMAGE_QUALITY = int(os.getenv("RUNWAY_IMAGE_QUALITY", "90"))
+
+
+def prepare_runway_image(image_bytes: bytes, ratio: str = '720:1280', quality: int = RUNWAY_IMAGE_QUALITY) -> str:
+    """Center-crop and resize an image to the output ratio and return it as a JPEG data URL.
+
+    Args:
+        image_bytes (bytes): Image in any format Pillow can read
+        ratio (str): Runway output ratio as 'width:height' in pixels
+        quality (int): JPEG quality
+
+    Returns:
+        str: 'data:image/jpeg;base64,...' URL
+    """
+    width, height = (int(value) for value in ratio.split(':'))
+    with Image.open(BytesIO(image_bytes)) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        image = ImageOps.fit(image, (width, height), method=Image.LANCZOS)
+        buffer = BytesIO()
+        image.save(buffer, format='JPEG', quality=quality, optimize=True)
+    return f"data:image/jpeg;base64,{base64.b64encode(buffer.getvalue()).decode('ascii')}"
+
+
 class VideoGenerator:
     def __init__(self):
-        self.runway = RunwayML()
+        self.runway = get_runway_client()
         
-    def generate_video(self,
-                       image_base64: str,
+    async def generate_video(self,
+                       image_bytes: bytes,
                        output_path: str,
                        prompt_text: str = '',
                        ratio: str = '720:1280') -> str:
         """Generate a video from an input image using Runway's Gen-4 model.
         
         Args:
-            image_path (str): Path to the input image
+            image_bytes (bytes): Input image, resized and cropped to the ratio before upload
             output_path (Optional[str]): Path to save the output video. If None, saves to 'output.mp4'
             prompt_text (str): Optional text prompt to guide the video generation
             ratio (str): Aspect ratio of the output video. Default is '16:9'
@@ -41,8 +68,8 @@ class VideoGenerator:
             if output_dir:
                 Path(output_dir).mkdir(parents=True, exist_ok=True)
                 
-            # Create data URL from base64 string
-            data_url = f'data:image/jpeg;base64,{image_base64}'
+            # Upload a JPEG at the output size instead of the full-size original
+            data_url = await run_blocking(prepare_runway_image, image_bytes, ratio)
             
             # Initialize the video generation task
             print(f"\n📝 Runway API Request:")
@@ -51,7 +78,8 @@ class VideoGenerator:
             print(f"Ratio: {ratio}")
             
             try:
-                task = self.runway.image_to_video.create(
+                task = await run_blocking(
+                    self.runway.image_to_video.create,
                     model='gen4_turbo',
                     prompt_image=data_url,
                     prompt_text=prompt_text,
@@ -87,30 +115,24 @@ class VideoGenerator:
                 raise
             task_id = task.id
             
-            # Initial wait before polling
-            time.sleep(10)
-            
             # Poll until task is complete
-            task = self.runway.tasks.retrieve(task_id)
-            while task.status not in ['SUCCEEDED', 'FAILED']:
-                time.sleep(10)
-                task = self.runway.tasks.retrieve(task_id)
+            task = await poll_until(
+                'runway',
+                lambda: self.runway.tasks.retrieve(task_id),
+                lambda task: task.status in ['SUCCEEDED', 'FAILED', 'CANCELLED'],
+                task_id=task_id
+            )
                 
-            if task.status == 'FAILED':
-                raise Exception(f'Task failed: {task.status}')
+            if task.status != 'SUCCEEDED':
+                raise Exception(f'Task failed: {task.status} {getattr(task, "failure", "") or ""}'.strip())
             
             # Download and save the video
             if hasattr(task, 'output') and task.output:
                 if isinstance(task.output, list) and len(task.output) > 0:
                     video_url = task.output[0]
                     
-                    # Download the video
-                    response = requests.get(video_url)
-                    response.raise_for_status()
-                    
-                    # Save to specified path
-                    with open(output_path, 'wb') as f:
-                        f.write(response.content)
+                    # Stream the video to the specified path
+                    await run_blocking(download_file, video_url, output_path)
                     
                     return output_path
                 else:
@@ -121,7 +143,7 @@ class VideoGenerator:
         except Exception as e:
             raise Exception(f'Error generating video: {str(e)}')
 
-def generate_video_from_image(image_base64: str,
+async def generate_video_from_image(image_bytes: bytes,
                              output_path: str,
                              prompt_text: str = '',
                              ratio: str = '720:1280',  # Portrait 9:16 ratio
@@ -129,9 +151,9 @@ def generate_video_from_image(image_base64: str,
     """Convenience function to generate a video from an image.
     
     Args:
-        image_path (str): Path to the input image
+        image_bytes (bytes): Input image
         prompt_text (str): Optional text prompt to guide the video generation
-        ratio (str): Aspect ratio of the output video (e.g., '16:9', '1:1', '9:16')
+        ratio (str): Output size as 'width:height' (e.g., '720:1280')
         **kwargs: Additional arguments to pass to VideoGenerator.generate_video()
         
     Returns:
@@ -140,8 +162,8 @@ def generate_video_from_image(image_base64: str,
     try:
         generator = VideoGenerator()
         
-        return generator.generate_video(
-            image_base64=image_base64,
+        return await generator.generate_video(
+            image_bytes=image_bytes,
             output_path=output_path,
             prompt_text=prompt_text,
             ratio=ratio,
@@ -154,16 +176,15 @@ def generate_video_from_image(image_base64: str,
 def main():
     # Example usage
     try:
-        # This would be your base64 image string
         with open('input.jpg', 'rb') as f:
-            image_base64 = base64.b64encode(f.read()).decode()
+            image_bytes = f.read()
             
-        output_path = generate_video_from_image(
-            image_base64=image_base64,
+        output_path = asyncio.run(generate_video_from_image(
+            image_bytes=image_bytes,
             output_path='output.mp4',
             prompt_text="A cinematic scene",
             ratio="720:1280"
-        )
+        ))
         print(f"\n✨ Video saved to: {output_path}")
     except Exception as e:
         print(f"\n❌ Error: {str(e)}")
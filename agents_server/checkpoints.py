@@ -0,0 +1,139 @@
+import hashlib
+import importlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+# Set to 0 to run every stage of a retried job again
+CHECKPOINTS_ENABLED = os.getenv("CHECKPOINTS_ENABLED", "1") == "1"
+
+MANIFEST_NAME = "manifest.json"
+
+
+def _encode(value: Any) -> Any:
+    """JSON-compatible form of a stage result. Pydantic models keep their class so they can be rebuilt."""
+    if isinstance(value, BaseModel):
+        cls = type(value)
+        return {"__model__": f"{cls.__module__}:{cls.__qualname__}", "data": value.model_dump(exclude_none=True)}
+    if isinstance(value, dict):
+        return {str(key): _encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    if isinstance(value, bytes):
+        # Only hashed, never restored: stages returning bytes should not be checkpointed
+        return {"__bytes__": hashlib.sha256(value).hexdigest()}
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    raise TypeError(f"Cannot checkpoint a value of type {type(value).__name__}")
+
+
+def _decode(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "__model__" in value:
+            module_name, _, class_name = value["__model__"].partition(":")
+            cls = getattr(importlib.import_module(module_name), class_name)
+            return cls.model_validate(value["data"])
+        return {key: _decode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+
+def _hash(value: Any) -> str:
+    return hashlib.sha256(json.dumps(_encode(value), sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _artifacts(value: Any) -> List[str]:
+    """Paths of the files a stage result points to."""
+    if isinstance(value, str):
+        return [value] if os.path.isabs(value) and os.path.isfile(value) else []
+    if isinstance(value, BaseModel):
+        return _artifacts(value.model_dump())
+    if isinstance(value, dict):
+        return [path for item in value.values() for path in _artifacts(item)]
+    if isinstance(value, (list, tuple)):
+        return [path for item in value for path in _artifacts(item)]
+    return []
+
+
+class JobManifest:
+    """Record of a job's stages in <job_dir>/manifest.json, used to resume a job where it stopped.
+
+    Each stage entry holds its status (running, completed or failed), a hash of its
+    inputs, its result and the files the result points to. A completed stage is
+    reused when its inputs hash still matches and all of its files still exist.
+    The file is replaced atomically after every change, so a crash leaves the last
+    complete state behind.
+    """
+
+    def __init__(self, job_dir: str, job_id: str, payload: Dict[str, Any]):
+        self.job_dir = job_dir
+        self.path = os.path.join(job_dir, MANIFEST_NAME)
+        self._lock = threading.Lock()
+        payload_hash = _hash(payload)
+        data = read_manifest(job_dir)
+        if data is None or data.get("payload_hash") != payload_hash:
+            # A different request under the same id starts from scratch
+            data = {"job_id": job_id, "payload": payload, "payload_hash": payload_hash, "stages": {}}
+        self.data = data
+        self._save()
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def _update(self, stage: str, **fields):
+        with self._lock:
+            entry = self.data["stages"].setdefault(stage, {})
+            entry.update(fields, updated=time.time())
+            self._save()
+
+    def restore(self, stage: str, inputs: Dict[str, Any]) -> Tuple[bool, Any]:
+        """Return (True, result) if the stage already completed with the same inputs."""
+        with self._lock:
+            entry = self.data["stages"].get(stage)
+        if not entry or entry.get("status") != "completed" or entry.get("inputs_hash") != _hash(inputs):
+            return False, None
+        if not all(os.path.isfile(path) for path in entry.get("artifacts", [])):
+            return False, None
+        try:
+            return True, _decode(entry["result"])
+        except Exception as e:
+            print(f"⚠️ Could not restore stage '{stage}' from its checkpoint: {str(e)}")
+            return False, None
+
+    def start(self, stage: str, inputs: Dict[str, Any]):
+        self._update(stage, status="running", inputs_hash=_hash(inputs), error=None)
+
+    def complete(self, stage: str, inputs: Dict[str, Any], result: Any, seconds: float):
+        self._update(
+            stage,
+            status="completed",
+            inputs_hash=_hash(inputs),
+            result=_encode(result),
+            artifacts=_artifacts(result),
+            seconds=round(seconds, 1),
+            error=None
+        )
+
+    def fail(self, stage: str, error: BaseException):
+        self._update(stage, status="failed", error=str(error))
+
+
+def read_manifest(job_dir: str) -> Optional[Dict[str, Any]]:
+    """Load a job's manifest, or None if the job never ran here."""
+    path = os.path.join(job_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Ignoring unreadable job manifest {path}: {str(e)}")
+        return None
@@ -0,0 +1,110 @@
+import asyncio
+import os
+import threading
+from typing import Any, Callable, Dict
+
+import aiohttp
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Hosts kept in the requests connection pool, and connections kept per host
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "16"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "64"))
+# Connection limits of the OpenAI and Runway SDK clients
+SDK_MAX_CONNECTIONS = int(os.getenv("SDK_MAX_CONNECTIONS", "100"))
+SDK_MAX_KEEPALIVE = int(os.getenv("SDK_MAX_KEEPALIVE", "20"))
+# Connection limits of the shared aiohttp session
+AIOHTTP_LIMIT = int(os.getenv("AIOHTTP_LIMIT", "100"))
+AIOHTTP_LIMIT_PER_HOST = int(os.getenv("AIOHTTP_LIMIT_PER_HOST", "20"))
+
+_lock = threading.Lock()
+_clients: Dict[str, Any] = {}
+
+
+def _get_or_create(name: str, factory: Callable[[], Any]) -> Any:
+    with _lock:
+        if name not in _clients:
+            _clients[name] = factory()
+        return _clients[name]
+
+
+def _sdk_limits() -> httpx.Limits:
+    return httpx.Limits(max_connections=SDK_MAX_CONNECTIONS, max_keepalive_connections=SDK_MAX_KEEPALIVE)
+
+
+def get_http_session() -> requests.Session:
+    """Process-wide requests session with keep-alive pooling, used for HeyGen, ZapCap and downloads."""
+    def create():
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+    return _get_or_create("http", create)
+
+
+def get_openai_client():
+    """Process-wide synchronous OpenAI client."""
+    from openai import DefaultHttpxClient, OpenAI
+    return _get_or_create(
+        "openai",
+        lambda: OpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=DefaultHttpxClient(limits=_sdk_limits())
+        )
+    )
+
+
+def get_async_openai_client():
+    """Process-wide asynchronous OpenAI client, also used by the agents SDK."""
+    from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+    return _get_or_create(
+        "async_openai",
+        lambda: AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=DefaultAsyncHttpxClient(limits=_sdk_limits())
+        )
+    )
+
+
+def get_runway_client():
+    """Process-wide RunwayML client."""
+    from runwayml import DefaultHttpxClient, RunwayML
+    return _get_or_create(
+        "runway",
+        lambda: RunwayML(http_client=DefaultHttpxClient(limits=_sdk_limits()))
+    )
+
+
+def get_aiohttp_session() -> aiohttp.ClientSession:
+    """Shared aiohttp session for the running event loop. Must be called from a coroutine."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        entry = _clients.get("aiohttp")
+        # Sessions are bound to the loop that created them
+        if entry is None or entry[0] is not loop or entry[1].closed:
+            connector = aiohttp.TCPConnector(limit=AIOHTTP_LIMIT, limit_per_host=AIOHTTP_LIMIT_PER_HOST)
+            entry = (loop, aiohttp.ClientSession(connector=connector))
+            _clients["aiohttp"] = entry
+        return entry[1]
+
+
+async def close_clients():
+    """Close every pooled client, e.g. on application shutdown."""
+    with _lock:
+        clients = dict(_clients)
+        _clients.clear()
+    for name, client in clients.items():
+        try:
+            if name == "aiohttp":
+                await client[1].close()
+            elif name == "async_openai":
+                await client.close()
+            else:
+                client.close()
+        except Exception as e:
+            print(f"⚠️ Failed to close {name} client: {str(e)}")
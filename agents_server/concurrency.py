@@ -0,0 +1,76 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+T = TypeVar("T")
+
+# Threads available for blocking provider calls (requests, time.sleep polling, subprocess)
+PIPELINE_THREADS = int(os.getenv("PIPELINE_THREADS", "32"))
+
+_executor = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Return the process-wide executor used for blocking pipeline work."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=PIPELINE_THREADS,
+            thread_name_prefix="pipeline"
+        )
+    return _executor
+
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking callable on the shared executor without stalling the event loop.
+
+    Use it for every disk or network call made from async code, including the methods
+    of the file-backed stores (AvatarCache, JobManifest, AssetLibrary).
+    """
+    loop = asyncio.get_running_loop()
+    # Carry context variables over to the worker thread, like asyncio.to_thread does
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    return await loop.run_in_executor(get_executor(), call)
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+
+
+# Default number of in-flight calls per provider, override with e.g. RUNWAY_CONCURRENCY=8
+DEFAULT_PROVIDER_CONCURRENCY = {
+    "openai": 8,
+    "dalle": 4,
+    "runway": 4,
+    "heygen": 4,
+    "zapcap": 2,
+    # Concurrent ffmpeg encodes on this node
+    "ffmpeg": max(1, (os.cpu_count() or 2) // 2),
+}
+
+_provider_limits = {}
+
+
+def provider_limit(provider: str) -> asyncio.Semaphore:
+    """Return the semaphore bounding concurrent calls to a provider.
+
+    Usage:
+        async with provider_limit("runway"):
+            ...
+    """
+    loop = asyncio.get_running_loop()
+    entry = _provider_limits.get(provider)
+    # Semaphores are bound to the loop they are first used on
+    if entry is None or entry[0] is not loop:
+        default = DEFAULT_PROVIDER_CONCURRENCY.get(provider, 4)
+        limit = int(os.getenv(f"{provider.upper()}_CONCURRENCY", str(default)))
+        entry = (loop, asyncio.Semaphore(max(1, limit)))
+        _provider_limits[provider] = entry
+    return entry[1]
@@ -0,0 +1,246 @@
+import base64
+import hashlib
+import io
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional
+
+import requests
+
+from agents_server.clients import get_http_session
+
+# Size of the buffer each stream reads into
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", str(1024 * 1024)))
+# Files at least this large are fetched with parallel range requests
+DOWNLOAD_PARALLEL_THRESHOLD = int(os.getenv("DOWNLOAD_PARALLEL_THRESHOLD", str(16 * 1024 * 1024)))
+# Number of concurrent range requests for a large file
+DOWNLOAD_PARTS = int(os.getenv("DOWNLOAD_PARTS", "4"))
+# Retries per stream, each one resumes where the previous attempt stopped
+DOWNLOAD_RETRIES = int(os.getenv("DOWNLOAD_RETRIES", "3"))
+# Connect/read timeout in seconds
+DOWNLOAD_TIMEOUT = float(os.getenv("DOWNLOAD_TIMEOUT", "60"))
+
+
+class DownloadError(Exception):
+    pass
+
+
+def _expected_md5(headers) -> Optional[str]:
+    """Return the hex MD5 advertised by the server, if any (Content-MD5 or x-goog-hash)."""
+    encoded = headers.get("Content-MD5")
+    if not encoded:
+        for part in headers.get("x-goog-hash", "").split(","):
+            key, _, value = part.strip().partition("=")
+            if key == "md5":
+                encoded = value
+    if not encoded:
+        return None
+    try:
+        return base64.b64decode(encoded).hex()
+    except ValueError:
+        return None
+
+
+def _file_digest(path: str, algorithm: str) -> str:
+    digest = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _probe(session: requests.Session, url: str, headers: Dict[str, str]):
+    """Return (size, supports_ranges, response headers) from a HEAD request, or (None, False, {})."""
+    try:
+        response = session.head(url, headers=headers, allow_redirects=True, timeout=DOWNLOAD_TIMEOUT)
+        response.raise_for_status()
+    except requests.RequestException:
+        return None, False, {}
+    length = response.headers.get("Content-Length")
+    size = int(length) if length and length.isdigit() else None
+    ranges = response.headers.get("Accept-Ranges", "").lower() == "bytes"
+    return size, ranges, response.headers
+
+
+def _range_start(content_range: str) -> Optional[int]:
+    """First byte of a 'bytes <first>-<last>/<total>' Content-Range header, or None if it does not parse."""
+    unit, _, spec = content_range.strip().partition(" ")
+    first = spec.partition("-")[0]
+    return int(first) if unit == "bytes" and first.isdigit() else None
+
+
+def _fetch_range(
+    session: requests.Session,
+    url: str,
+    path: str,
+    start: int,
+    end: Optional[int],
+    headers: Dict[str, str],
+    retries: int
+) -> int:
+    """
+    Stream bytes [start, end] of the URL into the file at the same offsets, resuming after failures.
+    end=None streams until the end of the file. Returns the number of bytes written.
+
+    A 206 response must start at the requested offset, and a bounded range must arrive in
+    full, since the pre-sized part file would otherwise hide misplaced or missing bytes.
+    """
+    expected = None if end is None else end - start + 1
+    written = 0
+    for attempt in range(retries + 1):
+        offset = start + written
+        request_headers = dict(headers)
+        if offset > 0 or end is not None:
+            request_headers["Range"] = f"bytes={offset}-{'' if end is None else end}"
+        try:
+            with session.get(url, headers=request_headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+                response.raise_for_status()
+                if "Range" in request_headers and response.status_code != 206:
+                    if end is not None:
+                        raise DownloadError("Server ignored the range request")
+                    # No range support, start over from the beginning
+                    written = 0
+                    offset = start
+                if response.status_code == 206:
+                    first = _range_start(response.headers.get("Content-Range", ""))
+                    if first != offset:
+                        raise DownloadError(
+                            f"Server answered the range from byte {offset} with Content-Range "
+                            f"'{response.headers.get('Content-Range')}'"
+                        )
+                with open(path, "r+b") as f:
+                    f.seek(offset)
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        if chunk:
+                            if expected is not None and written + len(chunk) > expected:
+                                raise DownloadError(f"Server sent more than the {expected} bytes requested from byte {start}")
+                            f.write(chunk)
+                            written += len(chunk)
+            if expected is not None and written < expected:
+                # Resumed from the last byte written by the next attempt
+                raise requests.RequestException(f"Stream ended after {written} of {expected} bytes")
+            return written
+        except (requests.RequestException, OSError) as e:
+            if attempt == retries:
+                raise DownloadError(f"Download of {url} failed after {retries + 1} attempts: {e}") from e
+            wait = 2 ** attempt
+            print(f"⚠️ Download interrupted at byte {start + written}, resuming in {wait}s: {e}")
+            time.sleep(wait)
+    return written
+
+
+def download_file(
+    url: str,
+    output_path: str,
+    expected_size: Optional[int] = None,
+    sha256: Optional[str] = None,
+    session: Optional[requests.Session] = None,
+    headers: Optional[Dict[str, str]] = None,
+    retries: int = DOWNLOAD_RETRIES
+) -> str:
+    """Download a URL to disk with a small, fixed memory footprint.
+
+    The body is streamed in DOWNLOAD_CHUNK_SIZE chunks into '<output_path>.part'. Large files
+    are split into DOWNLOAD_PARTS concurrent range requests, and interrupted streams resume
+    from the last byte written. The file is moved into place only once its length (and
+    checksum, when known) has been verified.
+
+    Args:
+        url (str): URL to download
+        output_path (str): Destination file
+        expected_size (int, optional): Expected length in bytes
+        sha256 (str, optional): Expected SHA-256 hex digest
+        session (requests.Session, optional): Session to use, defaults to the shared pooled session
+        headers (dict, optional): Extra request headers
+        retries (int): Resume attempts per stream
+
+    Returns:
+        str: output_path
+
+    Raises:
+        DownloadError: If the download fails or does not verify
+    """
+    session = session or get_http_session()
+    # Byte ranges and lengths must refer to the stored file, not a compressed transfer
+    headers = {"Accept-Encoding": "identity", **(headers or {})}
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    size, ranges, response_headers = _probe(session, url, headers)
+    if expected_size is not None and size is not None and size != expected_size:
+        raise DownloadError(f"Server reports {size} bytes for {url}, expected {expected_size}")
+    size = size if size is not None else expected_size
+
+    part_path = f"{output_path}.part"
+    try:
+        with open(part_path, "wb") as f:
+            if size:
+                f.truncate(size)
+
+        if size and ranges and size >= DOWNLOAD_PARALLEL_THRESHOLD and DOWNLOAD_PARTS > 1:
+            part_size = -(-size // DOWNLOAD_PARTS)
+            bounds = [
+                (start, min(start + part_size, size) - 1)
+                for start in range(0, size, part_size)
+            ]
+            with ThreadPoolExecutor(max_workers=len(bounds), thread_name_prefix="download") as pool:
+                list(pool.map(
+                    lambda bound: _fetch_range(session, url, part_path, bound[0], bound[1], headers, retries),
+                    bounds
+                ))
+        else:
+            written = _fetch_range(session, url, part_path, 0, None, headers, retries)
+            if size is None:
+                size = written
+            with open(part_path, "r+b") as f:
+                f.truncate(written)
+
+        actual_size = os.path.getsize(part_path)
+        if size is not None and actual_size != size:
+            raise DownloadError(f"Downloaded {actual_size} bytes from {url}, expected {size}")
+        if sha256 and _file_digest(part_path, "sha256") != sha256.lower():
+            raise DownloadError(f"SHA-256 mismatch for {url}")
+        md5 = _expected_md5(response_headers)
+        if md5 and _file_digest(part_path, "md5") != md5:
+            raise DownloadError(f"MD5 mismatch for {url}")
+
+        os.replace(part_path, output_path)
+        return output_path
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+
+
+def download_bytes(
+    url: str,
+    max_size: int = 64 * 1024 * 1024,
+    session: Optional[requests.Session] = None,
+    retries: int = DOWNLOAD_RETRIES
+) -> bytes:
+    """Download a small payload such as an image into memory, with retries and a size cap."""
+    session = session or get_http_session()
+    for attempt in range(retries + 1):
+        buffer = io.BytesIO()
+        try:
+            # Content-Length must refer to the bytes we keep, not a compressed transfer
+            with session.get(url, headers={"Accept-Encoding": "identity"}, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+                response.raise_for_status()
+                # Servers may compress anyway, then the length cannot be checked against the decoded body
+                length = response.headers.get("Content-Length")
+                if response.headers.get("Content-Encoding", "identity") != "identity":
+                    length = None
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    buffer.write(chunk)
+                    if buffer.tell() > max_size:
+                        raise DownloadError(f"{url} is larger than {max_size} bytes")
+            if length and length.isdigit() and buffer.tell() != int(length):
+                raise requests.RequestException(f"Received {buffer.tell()} of {length} bytes")
+            return buffer.getvalue()
+        except requests.RequestException as e:
+            if attempt == retries:
+                raise DownloadError(f"Download of {url} failed after {retries + 1} attempts: {e}") from e
+            time.sleep(2 ** attempt)
@@ -0,0 +1,165 @@
+"""Local stand-in for the HeyGen, Runway and ZapCap APIs.
+
+Renders finish after FAKE_RENDER_SECONDS. Like the real API, a HeyGen render
+that was submitted with a callback_url is announced to it, so the whole provider
+path runs with no network. Start it with
+
+    uvicorn agents_server.fake_providers:app --port 9000
+
+and point the app at it:
+
+    HEYGEN_API_BASE=http://localhost:9000
+    RUNWAYML_BASE_URL=http://localhost:9000
+    ZAPCAP_API_BASE=http://localhost:9000
+    WEBHOOK_BASE_URL=http://localhost:8080
+"""
+import asyncio
+import os
+import subprocess
+import tempfile
+import time
+import uuid
+from typing import Any, Dict
+
+import aiohttp
+from fastapi import FastAPI, Request
+from fastapi.responses import FileResponse, JSONResponse
+
+# Seconds until a submitted task completes
+FAKE_RENDER_SECONDS = float(os.getenv("FAKE_RENDER_SECONDS", "3"))
+# Length of the generated avatar video
+FAKE_VIDEO_SECONDS = float(os.getenv("FAKE_VIDEO_SECONDS", "6"))
+
+MEDIA_DIR = os.getenv("FAKE_MEDIA_DIR", os.path.join(tempfile.gettempdir(), "fake_providers"))
+
+app = FastAPI()
+
+_tasks: Dict[str, Dict[str, Any]] = {}
+
+
+def _media_path(name: str) -> str:
+    """Create the test clips on first use: a talking-head stand-in with audio and a silent b-roll clip."""
+    os.makedirs(MEDIA_DIR, exist_ok=True)
+    path = os.path.join(MEDIA_DIR, f"{name}.mp4")
+    if os.path.exists(path):
+        return path
+    if name == "avatar":
+        inputs = [
+            "-f", "lavfi", "-i", f"testsrc2=size=720x1280:rate=25:duration={FAKE_VIDEO_SECONDS}",
+            "-f", "lavfi", "-i", f"sine=frequency=220:duration={FAKE_VIDEO_SECONDS}",
+            "-c:a", "aac",
+        ]
+    else:
+        inputs = ["-f", "lavfi", "-i", "testsrc=size=720x1280:rate=24:duration=5"]
+    tmp_path = f"{path}.tmp.mp4"
+    subprocess.run(
+        ["ffmpeg", "-y", "-loglevel", "error", *inputs, "-c:v", "libx264", "-pix_fmt", "yuv420p", tmp_path],
+        check=True
+    )
+    os.replace(tmp_path, path)
+    return path
+
+
+def _create_task(provider: str, base_url: str, media: str, **fields) -> Dict[str, Any]:
+    task = {
+        "id": uuid.uuid4().hex,
+        "provider": provider,
+        "created": time.time(),
+        "done": False,
+        "media_url": f"{base_url.rstrip('/')}/media/{media}.mp4",
+        **fields,
+    }
+    _tasks[task["id"]] = task
+    asyncio.create_task(_complete(task))
+    return task
+
+
+async def _complete(task: Dict[str, Any]):
+    await asyncio.sleep(FAKE_RENDER_SECONDS)
+    task["done"] = True
+    if not task.get("callback_url"):
+        return
+    payload = {
+        "event_type": "avatar_video.success",
+        "event_data": {"video_id": task["id"], "url": task["media_url"]},
+    }
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.post(task["callback_url"], json=payload) as response:
+                print(f"📬 Sent {task['provider']} webhook for {task['id']}: {response.status}")
+    except Exception as e:
+        print(f"⚠️ Could not deliver {task['provider']} webhook: {str(e)}")
+
+
+def _unknown(task_id: str) -> JSONResponse:
+    return JSONResponse(status_code=404, content={"error": f"Unknown task: {task_id}"})
+
+
+@app.api_route("/media/{name}.mp4", methods=["GET", "HEAD"])
+async def media(name: str):
+    if name not in ("avatar", "broll"):
+        return JSONResponse(status_code=404, content={"error": f"Unknown media: {name}"})
+    path = await asyncio.to_thread(_media_path, name)
+    return FileResponse(path, media_type="video/mp4")
+
+
+# HeyGen
+@app.post("/v2/video/generate")
+async def heygen_generate(request: Request):
+    payload = await request.json()
+    task = _create_task("heygen", str(request.base_url), "avatar", callback_url=payload.get("callback_url"))
+    return {"error": None, "data": {"video_id": task["id"]}}
+
+
+@app.get("/v1/video_status.get")
+async def heygen_status(video_id: str):
+    task = _tasks.get(video_id)
+    if task is None:
+        return _unknown(video_id)
+    if not task["done"]:
+        return {"code": 100, "data": {"id": video_id, "status": "processing"}}
+    return {"code": 100, "data": {"id": video_id, "status": "completed", "video_url": task["media_url"]}}
+
+
+# Runway
+@app.post("/v1/image_to_video")
+async def runway_generate(request: Request):
+    await request.json()
+    task = _create_task("runway", str(request.base_url), "broll")
+    return {"id": task["id"]}
+
+
+@app.get("/v1/tasks/{task_id}")
+async def runway_task(task_id: str):
+    task = _tasks.get(task_id)
+    if task is None:
+        return _unknown(task_id)
+    created = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(task["created"]))
+    if not task["done"]:
+        return {"id": task_id, "status": "RUNNING", "createdAt": created, "progress": 0.5}
+    return {"id": task_id, "status": "SUCCEEDED", "createdAt": created, "output": [task["media_url"]]}
+
+
+# ZapCap
+@app.post("/videos")
+async def zapcap_upload(request: Request):
+    # The upload itself is discarded, the result is the generated avatar clip
+    await request.body()
+    return {"id": uuid.uuid4().hex}
+
+
+@app.post("/videos/{video_id}/task")
+async def zapcap_create_task(video_id: str, request: Request):
+    await request.json()
+    task = _create_task("zapcap", str(request.base_url), "avatar", video_id=video_id)
+    return {"taskId": task["id"]}
+
+
+@app.get("/videos/{video_id}/task/{task_id}")
+async def zapcap_task(video_id: str, task_id: str):
+    task = _tasks.get(task_id)
+    if task is None or task.get("video_id") != video_id:
+        return _unknown(task_id)
+    if not task["done"]:
+        return {"id": task_id, "status": "transcribing"}
+    return {"id": task_id, "status": "completed", "downloadUrl": task["media_url"]}
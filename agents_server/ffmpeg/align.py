@@ -0,0 +1,162 @@
+import os
+import re
+from typing import Any, Dict, List
+
+import numpy as np
+
+from agents_server.ffmpeg.extract_audio import SAMPLE_RATE
+
+# Analysis frame length in seconds
+FRAME_SECONDS = 0.02
+# Silences shorter than this are treated as part of the speech
+MIN_PAUSE_SECONDS = float(os.getenv("ALIGN_MIN_PAUSE", "0.12"))
+# How far an estimated phrase boundary may move to land on a pause
+SNAP_TOLERANCE_SECONDS = float(os.getenv("ALIGN_SNAP_TOLERANCE", "0.8"))
+# Phrases longer than this are split at commas, like Whisper's segments
+MAX_WORDS_PER_SEGMENT = int(os.getenv("ALIGN_MAX_WORDS", "14"))
+# Speaking rate of the avatar voice at speed 1.0, in letters per second
+LETTERS_PER_SECOND = float(os.getenv("SPEECH_LETTERS_PER_SECOND", "14"))
+# Silence between phrases at speed 1.0
+PHRASE_PAUSE_SECONDS = float(os.getenv("SPEECH_PHRASE_PAUSE", "0.25"))
+
+
+def split_script(script: str) -> List[str]:
+    """Split the spoken script into sentence or clause sized phrases."""
+    text = re.sub(r'["“”]', " ", script)
+    sentences = re.split(r"(?<=[.!?。！？;:])\s+|\n+", text)
+    phrases = []
+    for sentence in sentences:
+        sentence = " ".join(sentence.split())
+        if not sentence:
+            continue
+        if len(sentence.split()) <= MAX_WORDS_PER_SEGMENT:
+            phrases.append(sentence)
+            continue
+        # Break long sentences at commas, merging clauses back up to the word limit
+        current = ""
+        for clause in re.split(r"(?<=[,，])\s+", sentence):
+            candidate = f"{current} {clause}".strip()
+            if current and len(candidate.split()) > MAX_WORDS_PER_SEGMENT:
+                phrases.append(current)
+                current = clause
+            else:
+                current = candidate
+        if current:
+            phrases.append(current)
+    return phrases
+
+
+def _phrase_weight(phrase: str) -> float:
+    # Spoken duration follows the amount of text more closely than the word count
+    letters = len(re.sub(r"[\W_]", "", phrase))
+    return max(1.0, letters + 2.0 * len(re.findall(r"[,;:]", phrase)))
+
+
+def estimate_script_timings(script: str, voice_speed: float = 1.0) -> List[Dict[str, Any]]:
+    """
+    Estimate when each phrase of the script will be spoken, before any audio exists.
+
+    Phrase durations follow their length at LETTERS_PER_SECOND, scaled by the voice
+    speed passed to the TTS. The phrases are the same as align_script's, so the
+    estimate can later be mapped segment by segment onto the real timings.
+
+    Returns:
+        Segments in the same {start, end, text} format as transcribe_audio
+    """
+    segments = []
+    cursor = 0.0
+    for phrase in split_script(script):
+        duration = _phrase_weight(phrase) / LETTERS_PER_SECOND / voice_speed
+        segments.append({
+            "start": round(cursor, 2),
+            "end": round(cursor + duration, 2),
+            "text": phrase
+        })
+        cursor += duration + PHRASE_PAUSE_SECONDS / voice_speed
+    return segments
+
+
+def voiced_frames(audio: np.ndarray, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Return a boolean array marking the frames that contain speech, based on frame energy."""
+    hop = int(sample_rate * FRAME_SECONDS)
+    count = len(audio) // hop
+    if count == 0:
+        return np.zeros(0, dtype=bool)
+    frames = audio[:count * hop].reshape(count, hop)
+    energy = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+    noise_floor = np.percentile(energy, 10)
+    peak = np.percentile(energy, 99)
+    threshold = noise_floor + 0.3 * (peak - noise_floor)
+    return energy > threshold
+
+
+def find_pauses(voiced: np.ndarray) -> List[tuple]:
+    """Return (start, end) times of the silent runs between speech."""
+    pauses = []
+    start = None
+    for index, is_voiced in enumerate(voiced):
+        if not is_voiced and start is None:
+            start = index
+        elif is_voiced and start is not None:
+            if (index - start) * FRAME_SECONDS >= MIN_PAUSE_SECONDS:
+                pauses.append((start * FRAME_SECONDS, index * FRAME_SECONDS))
+            start = None
+    return pauses
+
+
+def align_script(script: str, audio: np.ndarray, sample_rate: int = SAMPLE_RATE) -> List[Dict[str, Any]]:
+    """
+    Align a known script to its spoken audio.
+
+    Text is spread over the voiced frames in proportion to its length, and every
+    phrase boundary is then snapped to the nearest pause.
+
+    Returns:
+        Segments in the same {start, end, text} format as transcribe_audio
+    """
+    phrases = split_script(script)
+    voiced = voiced_frames(audio, sample_rate)
+    if not phrases or not voiced.any():
+        raise ValueError("Nothing to align: empty script or no speech found")
+
+    voiced_indices = np.flatnonzero(voiced)
+    speech_start = voiced_indices[0] * FRAME_SECONDS
+    speech_end = (voiced_indices[-1] + 1) * FRAME_SECONDS
+    pauses = [
+        pause for pause in find_pauses(voiced)
+        if speech_start < pause[0] and pause[1] < speech_end
+    ]
+
+    # Cumulative speaking time at the end of every frame
+    speaking_time = np.cumsum(voiced) * FRAME_SECONDS
+    weights = np.array([_phrase_weight(phrase) for phrase in phrases])
+    targets = np.cumsum(weights)[:-1] / weights.sum() * speaking_time[-1]
+
+    boundaries = []
+    previous = speech_start
+    for target in targets:
+        frame = int(np.searchsorted(speaking_time, target))
+        estimate = frame * FRAME_SECONDS
+        nearby = [
+            pause for pause in pauses
+            if abs((pause[0] + pause[1]) / 2 - estimate) <= SNAP_TOLERANCE_SECONDS and pause[0] > previous
+        ]
+        if nearby:
+            pause = min(nearby, key=lambda p: abs((p[0] + p[1]) / 2 - estimate))
+            boundary = (pause[0], pause[1])
+        else:
+            estimate = max(estimate, previous)
+            boundary = (estimate, estimate)
+        boundaries.append(boundary)
+        previous = boundary[1]
+
+    starts = [speech_start] + [boundary[1] for boundary in boundaries]
+    ends = [boundary[0] for boundary in boundaries] + [speech_end]
+    return [
+        {
+            "start": round(float(start), 2),
+            "end": round(float(max(end, start)), 2),
+            "text": phrase
+        }
+        for phrase, start, end in zip(phrases, starts, ends)
+    ]
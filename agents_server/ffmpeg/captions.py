@@ -0,0 +1,130 @@
+import os
+import re
+from typing import Any, Dict, List
+
+# Caption styles. Colours are ASS &HAABBGGRR values, sizes are relative to a 720x1280 frame.
+CAPTION_TEMPLATES = {
+    "bold": {
+        "font": "Arial",
+        "size": 64,
+        "primary_colour": "&H0000E5FF",    # spoken words turn yellow
+        "secondary_colour": "&H00FFFFFF",  # upcoming words are white
+        "outline_colour": "&H00000000",
+        "outline": 5,
+        "shadow": 2,
+        "bold": True,
+        "uppercase": True,
+        "karaoke": True,
+        "margin_v": 360,
+        "words_per_caption": 3,
+    },
+    "classic": {
+        "font": "Arial",
+        "size": 48,
+        "primary_colour": "&H00FFFFFF",
+        "secondary_colour": "&H00FFFFFF",
+        "outline_colour": "&H00000000",
+        "outline": 3,
+        "shadow": 1,
+        "bold": False,
+        "uppercase": False,
+        "karaoke": False,
+        "margin_v": 200,
+        "words_per_caption": 6,
+    },
+}
+
+DEFAULT_CAPTION_TEMPLATE = os.getenv("CAPTION_TEMPLATE", "bold")
+
+PLAY_RES_X = 720
+PLAY_RES_Y = 1280
+
+
+def _timestamp(seconds: float) -> str:
+    centiseconds = int(round(max(seconds, 0.0) * 100))
+    hours, centiseconds = divmod(centiseconds, 360000)
+    minutes, centiseconds = divmod(centiseconds, 6000)
+    secs, centiseconds = divmod(centiseconds, 100)
+    return f"{hours}:{minutes:02d}:{secs:02d}.{centiseconds:02d}"
+
+
+def _clean(word: str) -> str:
+    # Braces start override blocks in ASS
+    return word.replace("{", "(").replace("}", ")").replace("\\", "/")
+
+
+def caption_events(segments: List[Dict[str, Any]], words_per_caption: int) -> List[Dict[str, Any]]:
+    """
+    Break timed segments into short captions of a few words, each word with its own timing.
+    Word times are spread over the segment in proportion to their length.
+    """
+    events = []
+    for segment in segments:
+        words = segment["text"].split()
+        if not words:
+            continue
+        duration = max(segment["end"] - segment["start"], 0.01)
+        weights = [len(re.sub(r"\W", "", word)) + 1 for word in words]
+        total = float(sum(weights))
+
+        timed = []
+        cursor = segment["start"]
+        for word, weight in zip(words, weights):
+            length = duration * weight / total
+            timed.append((word, cursor, cursor + length))
+            cursor += length
+
+        for index in range(0, len(timed), words_per_caption):
+            chunk = timed[index:index + words_per_caption]
+            events.append({
+                "start": chunk[0][1],
+                "end": chunk[-1][2],
+                "words": chunk,
+            })
+    return events
+
+
+def build_ass(segments: List[Dict[str, Any]], output_path: str, template: str = DEFAULT_CAPTION_TEMPLATE) -> str:
+    """Write an ASS subtitle file for the segments using one of CAPTION_TEMPLATES."""
+    style = CAPTION_TEMPLATES.get(template, CAPTION_TEMPLATES["bold"])
+    lines = [
+        "[Script Info]",
+        "ScriptType: v4.00+",
+        f"PlayResX: {PLAY_RES_X}",
+        f"PlayResY: {PLAY_RES_Y}",
+        "WrapStyle: 0",
+        "ScaledBorderAndShadow: yes",
+        "",
+        "[V4+ Styles]",
+        "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
+        "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, "
+        "Alignment, MarginL, MarginR, MarginV, Encoding",
+        f"Style: Caption,{style['font']},{style['size']},{style['primary_colour']},{style['secondary_colour']},"
+        f"{style['outline_colour']},&H80000000,{-1 if style['bold'] else 0},0,0,0,100,100,0,0,1,"
+        f"{style['outline']},{style['shadow']},2,40,40,{style['margin_v']},1",
+        "",
+        "[Events]",
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+    ]
+
+    for event in caption_events(segments, style["words_per_caption"]):
+        parts = []
+        for word, start, end in event["words"]:
+            word = _clean(word.upper() if style["uppercase"] else word)
+            if style["karaoke"]:
+                parts.append(f"{{\\k{max(1, int(round((end - start) * 100)))}}}{word}")
+            else:
+                parts.append(word)
+        lines.append(
+            f"Dialogue: 0,{_timestamp(event['start'])},{_timestamp(event['end'])},Caption,,0,0,0,,{' '.join(parts)}"
+        )
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return output_path
+
+
+def ass_filter(subtitles_path: str) -> str:
+    """Return an ffmpeg filter that burns in the given ASS file."""
+    escaped = subtitles_path.replace("\\", "\\\\").replace(":", "\\:").replace("'", "\\'")
+    return f"ass={escaped}"
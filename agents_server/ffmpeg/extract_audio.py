@@ -1,6 +1,11 @@
-import subprocess
+import asyncio
+import numpy as np
+from agents_server.ffmpeg.runner import run_media
 
-def extract_audio(video_path, output_path):
+# Whisper expects 16 kHz mono audio
+SAMPLE_RATE = 16000
+
+async def extract_audio(video_path, output_path):
     cmd = [
         "ffmpeg",
         "-i", video_path,
@@ -8,7 +13,25 @@ def extract_audio(video_path, output_path):
         "-map", "0:a",
         output_path
     ]
-    subprocess.run(cmd, check=True)
+    await run_media(cmd)
+
+async def extract_audio_pcm(video_path, sample_rate=SAMPLE_RATE):
+    """Decode the audio track of a video straight into a mono float32 array, without a temp file."""
+    cmd = [
+        "ffmpeg",
+        "-nostdin",
+        "-loglevel", "error",
+        "-i", video_path,
+        "-vn",
+        "-f", "s16le",
+        "-ac", "1",
+        "-acodec", "pcm_s16le",
+        "-ar", str(sample_rate),
+        "pipe:1"
+    ]
+    # Decoding audio is cheap, it should not wait for or hold one of the encoder slots
+    pcm = await run_media(cmd, encode=False, capture_stdout=True)
+    return np.frombuffer(pcm, np.int16).astype(np.float32) / 32768.0
 
 if __name__ == "__main__":
-    extract_audio("./demo_video.mp4", "./demo_audio.mp3")
\ No newline at end of file
+    asyncio.run(extract_audio("./demo_video.mp4", "./demo_audio.mp3"))
@@ -0,0 +1,190 @@
+import asyncio
+import os
+import re
+import signal
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+from agents_server.concurrency import provider_limit
+
+# Wall-clock limit for a single ffmpeg/ffprobe process
+MEDIA_PROCESS_TIMEOUT = float(os.getenv("MEDIA_PROCESS_TIMEOUT", "1800"))
+# An ffmpeg process that reports no progress for this long is considered stuck
+MEDIA_STALL_TIMEOUT = float(os.getenv("MEDIA_STALL_TIMEOUT", "120"))
+# Seconds between progress log lines
+PROGRESS_LOG_INTERVAL = float(os.getenv("MEDIA_PROGRESS_LOG_INTERVAL", "5"))
+
+_PROGRESS_LINE = re.compile(r"^([a-z0-9_]+)=(\S*)$")
+
+ProgressCallback = Callable[[Dict[str, Any]], None]
+
+
+class MediaProcessError(Exception):
+    def __init__(self, message: str, returncode: Optional[int] = None, log: str = ""):
+        super().__init__(f"{message}\n{log}" if log else message)
+        self.returncode = returncode
+        self.log = log
+
+
+class MediaProcessTimeout(MediaProcessError):
+    pass
+
+
+def _parse_progress(raw: Dict[str, str], duration: Optional[float]) -> Dict[str, Any]:
+    progress: Dict[str, Any] = {"status": raw.get("progress", "continue")}
+    try:
+        progress["frame"] = int(raw.get("frame", 0))
+        progress["fps"] = float(raw.get("fps", 0) or 0)
+    except ValueError:
+        pass
+    speed = raw.get("speed", "").rstrip("x")
+    progress["speed"] = float(speed) if re.match(r"^[0-9.]+$", speed) else None
+    out_time_us = raw.get("out_time_us") or raw.get("out_time_ms")
+    if out_time_us and out_time_us.lstrip("-").isdigit():
+        progress["out_time"] = max(int(out_time_us), 0) / 1_000_000
+        if duration:
+            progress["percent"] = min(100.0, progress["out_time"] / duration * 100)
+    return progress
+
+
+def _kill(process: asyncio.subprocess.Process):
+    """Kill the process and everything it spawned."""
+    if process.returncode is not None:
+        return
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+
+
+async def run_media(
+    cmd: List[str],
+    timeout: float = MEDIA_PROCESS_TIMEOUT,
+    stall_timeout: float = MEDIA_STALL_TIMEOUT,
+    encode: bool = True,
+    duration: Optional[float] = None,
+    on_progress: Optional[ProgressCallback] = None,
+    capture_stdout: bool = False
+) -> Optional[bytes]:
+    """Run ffmpeg or ffprobe without blocking the event loop.
+
+    ffmpeg is started with -progress so frame, fps and speed are parsed while it runs.
+    The whole process group is killed on timeout, on a stall, or when the calling task
+    is cancelled.
+
+    Args:
+        cmd (list): Command line, starting with 'ffmpeg' or 'ffprobe'
+        timeout (float): Wall-clock limit in seconds
+        stall_timeout (float): Kill ffmpeg if it reports no progress for this long
+        encode (bool): Take one of the node's encoder slots (FFMPEG_CONCURRENCY) while running
+        duration (float, optional): Expected output duration, used to compute a percentage
+        on_progress (callable, optional): Called with every parsed progress snapshot
+        capture_stdout (bool): Return the process stdout instead of discarding it
+
+    Returns:
+        bytes: stdout if capture_stdout is set, otherwise None
+
+    Raises:
+        MediaProcessTimeout: If the process exceeded its timeout or stalled
+        MediaProcessError: If the process exited with a non-zero status
+    """
+    is_ffmpeg = os.path.basename(cmd[0]) == "ffmpeg"
+    if is_ffmpeg:
+        cmd = [cmd[0], "-progress", "pipe:2", "-nostats", *cmd[1:]]
+
+    if encode:
+        async with provider_limit("ffmpeg"):
+            return await _run(cmd, timeout, stall_timeout if is_ffmpeg else None, duration, on_progress, capture_stdout)
+    return await _run(cmd, timeout, None, duration, on_progress, capture_stdout)
+
+
+async def _run(cmd, timeout, stall_timeout, duration, on_progress, capture_stdout):
+    name = os.path.basename(cmd[0])
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE if capture_stdout else asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+        start_new_session=True
+    )
+    log_tail: deque = deque(maxlen=40)
+    started = time.monotonic()
+    last_progress = started
+    last_logged = started
+
+    async def read_stderr():
+        nonlocal last_progress, last_logged
+        snapshot: Dict[str, str] = {}
+        async for raw_line in process.stderr:
+            line = raw_line.decode(errors="replace").strip()
+            match = _PROGRESS_LINE.match(line)
+            if not match:
+                if line:
+                    log_tail.append(line)
+                continue
+            snapshot[match.group(1)] = match.group(2)
+            if match.group(1) != "progress":
+                continue
+            last_progress = time.monotonic()
+            progress = _parse_progress(snapshot, duration)
+            snapshot = {}
+            if on_progress:
+                on_progress(progress)
+            if last_progress - last_logged >= PROGRESS_LOG_INTERVAL:
+                last_logged = last_progress
+                percent = f" {progress['percent']:.0f}%" if "percent" in progress else ""
+                print(f"🎞️ {name}{percent} frame={progress.get('frame')} fps={progress.get('fps')} speed={progress.get('speed')}x")
+
+    async def read_stdout():
+        if capture_stdout:
+            return await process.stdout.read()
+        return None
+
+    async def watchdog():
+        if not stall_timeout:
+            return
+        while process.returncode is None:
+            await asyncio.sleep(min(5.0, stall_timeout))
+            if process.returncode is None and time.monotonic() - last_progress > stall_timeout:
+                raise MediaProcessTimeout(
+                    f"{name} made no progress for {stall_timeout:.0f}s", log="\n".join(log_tail)
+                )
+
+    async def communicate():
+        _, stdout, _ = await asyncio.gather(read_stderr(), read_stdout(), process.wait())
+        return stdout
+
+    async def supervised():
+        # Whichever finishes first: the process, or the watchdog flagging a stall
+        work = asyncio.create_task(communicate())
+        watch = asyncio.create_task(watchdog())
+        try:
+            done, _ = await asyncio.wait({work, watch}, return_when=asyncio.FIRST_COMPLETED)
+            if watch in done and watch.exception():
+                raise watch.exception()
+            return await work
+        finally:
+            for task in (work, watch):
+                task.cancel()
+
+    try:
+        stdout = await asyncio.wait_for(supervised(), timeout=timeout)
+    except asyncio.TimeoutError:
+        _kill(process)
+        await process.wait()
+        raise MediaProcessTimeout(f"{name} timed out after {timeout:.0f}s", log="\n".join(log_tail))
+    except BaseException:
+        # Cancelled job or stalled process: never leave an orphaned encoder behind
+        _kill(process)
+        await process.wait()
+        raise
+
+    if process.returncode != 0:
+        raise MediaProcessError(
+            f"{name} exited with status {process.returncode}", process.returncode, "\n".join(log_tail)
+        )
+    return stdout
@@ -1,9 +1,45 @@
-import whisper
+import os
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional
 
-def transcribe_audio(audio_path):
-    model = whisper.load_model("base")  # or "small", "medium"
-    result = model.transcribe(audio_path)
+# Whisper model size: tiny, base, small, medium, large
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "base")
+# Torch threads per transcription worker (0 keeps the torch default)
+WHISPER_THREADS = int(os.getenv("WHISPER_THREADS", "0"))
+# Worker processes, each holding its own copy of the model
+WHISPER_WORKERS = int(os.getenv("WHISPER_WORKERS", "1"))
 
+# Model of the current worker process, loaded once by _load_model
+_model = None
+
+
+def _load_model(model_name: str, threads: int):
+    global _model
+    import torch
+    import whisper
+
+    if threads > 0:
+        torch.set_num_threads(threads)
+    _model = whisper.load_model(model_name)
+    print(f"🗣️ Whisper '{model_name}' model loaded in worker {os.getpid()}")
+
+
+def _language_code(language: Optional[str]) -> Optional[str]:
+    """Map a language name such as 'English' to Whisper's code, None lets Whisper detect it."""
+    if not language:
+        return None
+    from whisper.tokenizer import LANGUAGES, TO_LANGUAGE_CODE
+
+    language = language.strip().lower()
+    if language in LANGUAGES:
+        return language
+    return TO_LANGUAGE_CODE.get(language)
+
+
+def _segments(result) -> List[Dict[str, Any]]:
     segments_data = []
     for segment in result['segments']:
         entry = {
@@ -12,10 +48,124 @@ def transcribe_audio(audio_path):
             "text": segment["text"].strip()
         }
         segments_data.append(entry)
-
     return segments_data
 
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def _transcribe(audio, language):
+    """Transcribe one audio file or array with the worker's model."""
+    result = _model.transcribe(audio, language=_language_code(language), fp16=False)
+    return _segments(result)
+
+
+class TranscriptionService:
+    """Long-lived Whisper workers that load the model once and serve many pipelines.
+
+    Every job is its own task on the process pool, so concurrent jobs spread over
+    all idle workers and only queue when every worker is busy.
+    """
+
+    def __init__(
+        self,
+        model_name: str = WHISPER_MODEL,
+        threads: int = WHISPER_THREADS,
+        workers: int = WHISPER_WORKERS
+    ):
+        self.model_name = model_name
+        self.threads = threads
+        self.workers = max(1, workers)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def start(self) -> ProcessPoolExecutor:
+        """Spawn the worker processes and wait until every model is loaded.
+
+        Returns:
+            ProcessPoolExecutor: The running pool, read under the lock so a concurrent
+                shutdown cannot swap it for None
+
+        Raises:
+            Exception: If a worker could not load the model. The pool is discarded,
+                so the next call starts over.
+        """
+        with self._lock:
+            if self._executor is not None:
+                return self._executor
+            executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_load_model,
+                initargs=(self.model_name, self.threads)
+            )
+            # Block until the workers are up so the first job does not pay for model loading
+            try:
+                for future in [executor.submit(_ping) for _ in range(self.workers)]:
+                    future.result()
+            except Exception as e:
+                executor.shutdown(wait=False, cancel_futures=True)
+                print(f"❌ Could not start the Whisper workers: {str(e)}")
+                raise
+            self._executor = executor
+            return executor
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is None:
+                return
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _discard(self, executor):
+        """Drop a broken pool, the next job starts a new one."""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, audio, language):
+        executor = self.start()
+        try:
+            return executor, executor.submit(_transcribe, audio, language)
+        except RuntimeError:
+            # BrokenProcessPool, or a pool that was shut down after start() returned it
+            print("⚠️ Whisper worker pool is broken or shut down, restarting it")
+            self._discard(executor)
+            executor = self.start()
+            return executor, executor.submit(_transcribe, audio, language)
+
+    def submit(self, audio, language: Optional[str] = None) -> Future:
+        """Queue an audio file path (or 16 kHz mono float32 array) for transcription."""
+        return self._submit(audio, language)[1]
+
+    def transcribe(self, audio, language: Optional[str] = None) -> List[Dict[str, Any]]:
+        executor, future = self._submit(audio, language)
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            # A worker died, e.g. out of memory: later jobs get fresh workers
+            self._discard(executor)
+            raise
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_transcription_service() -> TranscriptionService:
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = TranscriptionService()
+        return _service
+
+
+def transcribe_audio(audio_path, language: Optional[str] = None):
+    return get_transcription_service().transcribe(audio_path, language)
+
 if __name__ == "__main__":
     transcript = transcribe_audio("demo_audio.mp3")
     print(transcript)
-    
+    get_transcription_service().shutdown()
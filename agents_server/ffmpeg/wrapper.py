@@ -1,7 +1,11 @@
 from agents_server.ffmpeg.extract_audio import extract_audio
 from agents_server.ffmpeg.transcribe import transcribe_audio
-import subprocess
+from agents_server.ffmpeg.captions import ass_filter
+from agents_server.ffmpeg.runner import run_media
+import asyncio
 import os
+import json
+import shutil
 import tempfile
 import ffmpeg
 
@@ -18,12 +22,12 @@ DUMMY_DATA = [
     }
 ]
 
-def build(video_path, output_path):
-    extract_audio(video_path, output_path)
+async def build(video_path, output_path):
+    await extract_audio(video_path, output_path)
     transcript_json = transcribe_audio(output_path)
     return transcript_json
 
-def get_video_duration(video_path):
+async def get_video_duration(video_path):
     """Get duration of a video file in seconds using ffprobe."""
     cmd = [
         'ffprobe', '-v', 'error',
@@ -31,16 +35,18 @@ def get_video_duration(video_path):
         '-of', 'default=noprint_wrappers=1:nokey=1',
         video_path
     ]
-    output = subprocess.check_output(cmd).decode().strip()
-    return float(output)
+    output = await run_media(cmd, encode=False, capture_stdout=True)
+    return float(output.decode().strip())
 
-def ffmpeg_merge(main_video, output_path, broll_data):
+async def ffmpeg_merge(main_video, output_path, broll_data, subtitles_path=None, on_progress=None):
     """
     Overlay b-roll videos visually on top of the main video at specified times,
     always keeping the original main video audio.
     main_video: path to a-roll video (with audio)
     output_path: path to output file
     broll_data: list of dicts, each with 'start', 'end', 'video_path'
+    subtitles_path: optional ASS file burned in during the same pass
+    on_progress: optional callback receiving ffmpeg progress snapshots
     """
     brolls = sorted(broll_data, key=lambda x: x['start'])
     input_args = ['-i', main_video]
@@ -66,24 +72,280 @@ def ffmpeg_merge(main_video, output_path, broll_data):
             f'{overlay_chain}[broll{b_idx}]overlay=enable=\'between(t,{b["start"]},{b["end"]})\':eof_action=pass{out_label}'
         )
         overlay_chain = out_label
+    # Burn in captions on top of the b-roll
+    if subtitles_path:
+        filter_chain.append(f'{overlay_chain}{ass_filter(subtitles_path)}[captioned]')
+        overlay_chain = '[captioned]'
+    if not filter_chain:
+        # Nothing to overlay, the filter graph would be empty
+        overlay_chain = '0:v'
     filter_complex = ';'.join(filter_chain)
     cmd = [
         'ffmpeg', '-y',
         *input_args,
-        '-filter_complex', filter_complex,
+        *(['-filter_complex', filter_complex] if filter_complex else []),
         '-map', overlay_chain,  # final video output
         '-map', '0:a',          # always use main video audio
         '-c:v', 'libx264',
         '-c:a', 'aac',
         output_path
     ]
-    subprocess.run(cmd, check=True)
+    duration = await get_video_duration(main_video) if on_progress else None
+    await run_media(cmd, duration=duration, on_progress=on_progress)
+
+
+async def probe_video(video_path):
+    """Return the codec parameters of the first video stream and the container duration."""
+    cmd = [
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'stream=codec_name,profile,width,height,pix_fmt,r_frame_rate,time_base:format=duration',
+        '-of', 'json',
+        video_path
+    ]
+    data = json.loads((await run_media(cmd, encode=False, capture_stdout=True)).decode())
+    stream = data['streams'][0]
+    return {
+        'codec': stream.get('codec_name'),
+        'profile': stream.get('profile'),
+        'width': int(stream['width']),
+        'height': int(stream['height']),
+        'pix_fmt': stream.get('pix_fmt') or 'yuv420p',
+        'fps': stream.get('r_frame_rate') or '30/1',
+        'timescale': int(stream.get('time_base', '1/15360').split('/')[1]),
+        'duration': float(data['format']['duration'])
+    }
+
+async def get_keyframes(video_path):
+    """Return the presentation times of every keyframe of the first video stream."""
+    cmd = [
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'v:0',
+        '-skip_frame', 'nokey',
+        '-show_entries', 'frame=pts_time',
+        '-of', 'csv=p=0',
+        video_path
+    ]
+    output = (await run_media(cmd, encode=False, capture_stdout=True)).decode()
+    return sorted(float(line.split(',')[0]) for line in output.split() if line.strip(','))
+
+def _encode_args(reference):
+    """Encoder settings producing segments that can be concatenated with the reference stream."""
+    args = [
+        '-c:v', 'libx264',
+        '-pix_fmt', reference['pix_fmt'],
+        '-r', reference['fps'],
+        '-video_track_timescale', str(reference['timescale'])
+    ]
+    if reference.get('codec') == 'h264' and reference.get('profile'):
+        profile = reference['profile'].lower().replace(' ', '')
+        if profile in ('baseline', 'constrainedbaseline', 'main', 'high'):
+            args += ['-profile:v', 'baseline' if 'baseline' in profile else profile]
+    return args
+
+async def normalize_broll(input_path, reference, output_path):
+    """
+    Re-encode a b-roll clip to the resolution, frame rate and pixel format of the a-roll,
+    so rendering a b-roll window only needs a cheap overlay.
+    reference: result of probe_video for the a-roll
+    """
+    width, height = reference['width'], reference['height']
+    cmd = [
+        'ffmpeg', '-y', '-v', 'error',
+        '-i', input_path,
+        '-vf', f'scale={width}:{height}:force_original_aspect_ratio=increase,crop={width}:{height},setsar=1',
+        '-an',
+        *_encode_args(reference),
+        output_path
+    ]
+    await run_media(cmd)
+    return output_path
+
+def _snap_windows(brolls, keyframes, duration):
+    """
+    Widen every b-roll window to the surrounding keyframes and merge windows that touch.
+    Returns a list of (start, end, brolls) tuples.
+    """
+    windows = []
+    for b in sorted(brolls, key=lambda x: x['start']):
+        start = max([k for k in keyframes if k <= b['start']] or [0.0])
+        end = min([k for k in keyframes if k >= b['end']] or [duration])
+        if windows and start <= windows[-1][1]:
+            previous = windows[-1]
+            windows[-1] = (previous[0], max(previous[1], end), previous[2] + [b])
+        else:
+            windows.append((start, end, [b]))
+    return windows
+
+async def _split_at_keyframes(main_video, boundaries, segment_dir):
+    """Stream-copy the a-roll video into pieces cut at the given keyframe times, in one pass."""
+    pattern = os.path.join(segment_dir, 'copy_%03d.mp4')
+    cmd = [
+        'ffmpeg', '-y', '-v', 'error',
+        '-i', main_video,
+        '-map', '0:v:0',
+        '-c', 'copy',
+        '-f', 'segment',
+        '-reset_timestamps', '1'
+    ]
+    if boundaries:
+        # The muxer cuts at the first keyframe at or after each time, step back a hair to absorb rounding
+        cmd += ['-segment_times', ','.join(f'{max(t - 0.001, 0.0):.6f}' for t in boundaries)]
+    cmd.append(pattern)
+    await run_media(cmd, encode=False)
+    pieces = [pattern % idx for idx in range(len(boundaries) + 1)]
+    if not all(os.path.exists(piece) for piece in pieces):
+        raise RuntimeError('Stream-copy split did not produce one piece per keyframe boundary')
+    return pieces
+
+async def _render_segment(main_video, reference, start, end, brolls, output_path):
+    input_args = ['-ss', f'{start:.6f}', '-t', f'{end - start:.6f}', '-i', main_video]
+    filter_chain = []
+    overlay_chain = '[0:v]'
+    for idx, b in enumerate(brolls):
+        b_idx = idx + 1
+        input_args += ['-i', b['video_path']]
+        offset = b['start'] - start
+        filter_chain.append(
+            f'[{b_idx}:v]setpts=PTS-STARTPTS+{offset}/TB[broll{b_idx}]'
+        )
+        out_label = f'[ov{b_idx}]'
+        filter_chain.append(
+            f'{overlay_chain}[broll{b_idx}]overlay=enable=\'between(t,{offset},{b["end"] - start})\':eof_action=pass{out_label}'
+        )
+        overlay_chain = out_label
+    cmd = [
+        'ffmpeg', '-y', '-v', 'error',
+        *input_args,
+        '-filter_complex', ';'.join(filter_chain),
+        '-map', overlay_chain,
+        '-an',
+        *_encode_args(reference),
+        output_path
+    ]
+    await run_media(cmd, duration=end - start)
+
+async def ffmpeg_smart_merge(main_video, output_path, broll_data, work_dir=None):
+    """
+    Same result as ffmpeg_merge, but only the b-roll windows are re-encoded.
+    Windows are widened to the a-roll's keyframes, every other part of the a-roll
+    is stream-copied, and the original audio track is muxed back without re-encoding.
+    broll_data: list of dicts, each with 'start', 'end', 'video_path'. Clips should
+    already be normalized to the a-roll with normalize_broll.
+    """
+    reference, keyframes = await asyncio.gather(probe_video(main_video), get_keyframes(main_video))
+    duration = reference['duration']
+    windows = _snap_windows(broll_data, keyframes, duration)
+
+    segment_dir = tempfile.mkdtemp(prefix='smart_merge_', dir=work_dir)
+    try:
+        boundaries = sorted({
+            t for start, end, _ in windows for t in (start, end)
+            if 0.0 < t < duration
+        })
+        pieces = await _split_at_keyframes(main_video, boundaries, segment_dir)
+        starts = [0.0] + boundaries
+
+        # Replace the pieces covered by a b-roll window with a re-encoded render
+        segment_paths = list(pieces)
+        renders = []
+        for idx, (start, end, brolls) in enumerate(windows):
+            render_path = os.path.join(segment_dir, f'render_{idx:03d}.mp4')
+            segment_paths[starts.index(start)] = render_path
+            renders.append(_render_segment(main_video, reference, start, end, brolls, render_path))
+        await asyncio.gather(*renders)
+
+        list_path = os.path.join(segment_dir, 'segments.txt')
+        with open(list_path, 'w') as f:
+            for segment_path in segment_paths:
+                f.write(f"file '{os.path.abspath(segment_path)}'\n")
+
+        cmd = [
+            'ffmpeg', '-y', '-v', 'error',
+            '-f', 'concat', '-safe', '0', '-i', list_path,
+            '-i', main_video,
+            '-map', '0:v', '-map', '1:a',
+            '-c', 'copy',
+            '-movflags', '+faststart',
+            output_path
+        ]
+        await run_media(cmd, encode=False)
+    finally:
+        shutil.rmtree(segment_dir, ignore_errors=True)
+
+def _same_stream(first, second):
+    keys = ('codec', 'profile', 'width', 'height', 'pix_fmt', 'fps')
+    return all(first[key] == second[key] for key in keys)
+
+async def ffmpeg_concat_clips(clip_paths, output_path, seam_fade=0.015):
+    """
+    Join clips rendered from consecutive parts of one script.
+    The video is stream-copied with the concat demuxer when every clip has the same
+    encoding, otherwise it is re-encoded to the first clip's settings. Each audio
+    track is padded or trimmed to its clip's length so speech stays in sync, then
+    faded out and in over seam_fade seconds at every seam to avoid clicks, and the
+    audio is re-encoded. This is not a crossfade: overlapping the tracks would
+    shorten the audio against the stream-copied video at every seam.
+    """
+    probes = await asyncio.gather(*(probe_video(path) for path in clip_paths))
+    reference = probes[0]
+    stream_copy = all(_same_stream(reference, probe) for probe in probes[1:])
+
+    work_dir = tempfile.mkdtemp(prefix='concat_', dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        list_path = os.path.join(work_dir, 'clips.txt')
+        with open(list_path, 'w') as f:
+            for clip_path in clip_paths:
+                f.write(f"file '{os.path.abspath(clip_path)}'\n")
+
+        input_args = ['-f', 'concat', '-safe', '0', '-i', list_path]
+        filter_chain = []
+        last = len(clip_paths) - 1
+        for idx, (clip_path, probe) in enumerate(zip(clip_paths, probes)):
+            input_args += ['-i', clip_path]
+            duration = probe['duration']
+            chain = f'[{idx + 1}:a]apad,atrim=0:{duration:.6f},asetpts=PTS-STARTPTS'
+            if idx > 0:
+                chain += f',afade=t=in:d={seam_fade}'
+            if idx < last:
+                chain += f',afade=t=out:st={max(duration - seam_fade, 0.0):.6f}:d={seam_fade}'
+            filter_chain.append(f'{chain}[a{idx}]')
+        audio_inputs = ''.join(f'[a{idx}]' for idx in range(len(clip_paths)))
+        filter_chain.append(f'{audio_inputs}concat=n={len(clip_paths)}:v=0:a=1[audio]')
+
+        if stream_copy:
+            video_args = ['-map', '0:v', '-c:v', 'copy']
+        else:
+            print("⚠️ Clips differ in encoding, re-encoding the video to join them")
+            width, height = reference['width'], reference['height']
+            for idx in range(len(clip_paths)):
+                filter_chain.append(
+                    f'[{idx + 1}:v]scale={width}:{height},setsar=1[v{idx}]'
+                )
+            video_inputs = ''.join(f'[v{idx}]' for idx in range(len(clip_paths)))
+            filter_chain.append(f'{video_inputs}concat=n={len(clip_paths)}:v=1:a=0[video]')
+            video_args = ['-map', '[video]', *_encode_args(reference)]
+
+        cmd = [
+            'ffmpeg', '-y', '-v', 'error',
+            *input_args,
+            '-filter_complex', ';'.join(filter_chain),
+            *video_args,
+            '-map', '[audio]',
+            '-c:a', 'aac',
+            '-movflags', '+faststart',
+            output_path
+        ]
+        await run_media(cmd, encode=not stream_copy, duration=sum(probe['duration'] for probe in probes))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return output_path
+
 
-    
 if __name__ == "__main__":
     video_path = "./demo_video.mp4"
     output_path = "./combined.mp4"
-    transcript_json = build(video_path, output_path)
+    transcript_json = asyncio.run(build(video_path, output_path))
     print(transcript_json)
     # ffmpeg_merge(video_path, output_path, DUMMY_DATA)
     
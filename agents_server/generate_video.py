@@ -4,20 +4,43 @@ from pathlib import Path
 from typing import Dict, Any, List
 import asyncio
 
-from agents_server.ffmpeg.extract_audio import extract_audio
+from agents_server.ffmpeg.extract_audio import extract_audio_pcm
 from agents_server.ffmpeg.transcribe import transcribe_audio
-from agents_server.ffmpeg.wrapper import ffmpeg_merge
-from agents_server.broll_generation.description_generator import generate_all_brolls
+from agents_server.ffmpeg.align import align_script, estimate_script_timings
+from agents_server.ffmpeg.captions import build_ass
+from agents_server.ffmpeg.wrapper import ffmpeg_merge, ffmpeg_smart_merge, normalize_broll, probe_video
+from agents_server.broll_generation.description_generator import generate_all_brolls, snap_broll_windows, BrollDescription
 from agents_server.broll_generation.broll import generate_broll_scene, generate_broll_for_product
 from agents_server.broll_generation.broll_image import generate_broll_image
 from agents_server.script import GenerateScript
 from agents_server.heygen import generate_avatar_video
 from agents_server.zapcap import ZapCapCaptionGenerator
-import base64
-import aiohttp
+from agents_server.clients import get_aiohttp_session
+from agents_server.concurrency import run_blocking
+from agents_server.pipeline import Pipeline, Stage, StageError
+from agents_server.checkpoints import CHECKPOINTS_ENABLED, JobManifest
+from agents_server.progress import report, ffmpeg_reporter
+import re
+import time
 import uuid
 from datetime import datetime
 
+# "align" maps the known script onto the avatar audio, "whisper" transcribes it
+TIMESTAMP_MODE = os.getenv("TIMESTAMP_MODE", "align")
+# "smart" re-encodes only the B-roll windows, "overlay" re-encodes the whole video
+MERGE_MODE = os.getenv("MERGE_MODE", "smart")
+# "local" burns captions in during the merge, "zapcap" sends the merged video to ZapCap
+CAPTIONS_MODE = os.getenv("CAPTIONS_MODE", "local")
+# Seconds a single B-roll scene may take before it is dropped from the video
+BROLL_SCENE_TIMEOUT = float(os.getenv("BROLL_SCENE_TIMEOUT", "600"))
+# "1" plans and generates B-roll from estimated script timings while the avatar renders
+SPECULATIVE_BROLL = os.getenv("SPECULATIVE_BROLL", "1") == "1"
+# Re-plan when the speech length differs from the estimate by more than this fraction
+# and the segments cannot be matched one to one
+SPECULATIVE_MAX_DRIFT = float(os.getenv("SPECULATIVE_MAX_DRIFT", "0.25"))
+
+AVATAR_ID = "046b2b11e4424b5c81f8d0223d3281d5"
+AVATAR_VOICE_SPEED = 1.1
 
 
 
@@ -26,11 +49,207 @@ def ensure_dir(path: str) -> str:
     os.makedirs(path, exist_ok=True)
     return path
 
-def generate_video_with_broll(
+async def transcribe_video(input_video_path: str, language: str = None) -> List[Dict[str, Any]]:
+    """Decode the audio track of a video in memory and transcribe it with timestamps."""
+    print("\n🎵 Extracting audio...")
+    audio = await extract_audio_pcm(input_video_path)
+
+    print("\n📝 Transcribing audio...")
+    return await run_blocking(transcribe_audio, audio, language=language)
+
+
+async def align_video(input_video_path: str, script: str, language: str = None) -> List[Dict[str, Any]]:
+    """
+    Timestamp the known script against the audio track of a video.
+    Falls back to Whisper transcription if the audio cannot be aligned.
+    """
+    print("\n🎵 Extracting audio...")
+    audio = await extract_audio_pcm(input_video_path)
+
+    print("\n📝 Aligning script to audio...")
+    try:
+        return await run_blocking(align_script, script, audio)
+    except Exception as e:
+        print(f"⚠️ Script alignment failed, transcribing instead: {str(e)}")
+        return await run_blocking(transcribe_audio, audio, language=language)
+
+
+async def generate_broll_scene_with_timeout(
+    index: int,
+    broll: BrollDescription,
+    broll_dir: str,
+    product_image: bytes = None,
+    reference: Dict[str, Any] = None
+) -> Dict[str, Any]:
+    """
+    Generate a single B-roll scene, giving up after BROLL_SCENE_TIMEOUT seconds.
+    If a reference (probe_video of the a-roll) is given, the clip is normalized to it right away.
+    """
+    scene_path = os.path.join(broll_dir, f"broll_{index:03d}.mp4")
+    if index != 0:
+        scene = generate_broll_scene(
+            dynamic_description=broll.description,
+            output_path=scene_path
+        )
+    else:
+        scene = generate_broll_for_product(
+            dynamic_description=broll.description,
+            output_path=scene_path,
+            product_image=product_image
+        )
+
+    try:
+        result = await asyncio.wait_for(scene, timeout=BROLL_SCENE_TIMEOUT)
+    except asyncio.TimeoutError:
+        return {
+            'success': False,
+            'error': f'Timed out after {BROLL_SCENE_TIMEOUT:.0f}s'
+        }
+
+    if result['success'] and reference is not None:
+        normalized_path = os.path.join(broll_dir, f"broll_{index:03d}_normalized.mp4")
+        try:
+            result['video_path'] = await normalize_broll(result['video_path'], reference, normalized_path)
+        except Exception as e:
+            print(f"⚠️ Could not normalize scene {index+1}, using the original clip: {str(e)}")
+    return result
+
+
+async def generate_broll_scenes(
+    broll_descriptions: List[BrollDescription],
+    broll_dir: str,
+    product_image: bytes = None,
+    reference: Dict[str, Any] = None,
+    stage: str = "brolls"
+) -> List[BrollDescription]:
+    """
+    Generate the video of every B-roll description concurrently. The first
+    description is the product movement scene and is animated from the product image.
+    Clips are normalized to the reference a-roll parameters as they arrive, if given.
+    Every scene reports progress as broll_<index>, and stage reports the share of finished scenes.
+
+    Returns:
+        The descriptions whose scene was generated successfully, in their original order, with video_path set
+    """
+    total_scenes = len(broll_descriptions)
+
+    print(f"\n🎬 Generating {total_scenes} B-roll scenes...")
+    for i, broll in enumerate(broll_descriptions):
+        print(f"\n📽️ Scene {i+1}/{total_scenes}:")
+        print(f"Description: {broll.description[:100]}...")
+
+    finished = 0
+
+    async def run_scene(i, broll):
+        nonlocal finished
+        started = time.monotonic()
+        report(f"broll_{i}", "started", 0.0, description=broll.description[:100])
+        try:
+            result = await generate_broll_scene_with_timeout(i, broll, broll_dir, product_image, reference)
+        except Exception as e:
+            report(f"broll_{i}", "failed", seconds=round(time.monotonic() - started, 2), error=str(e))
+            raise
+        finished += 1
+        report(
+            f"broll_{i}",
+            "completed" if result['success'] else "failed",
+            100.0 if result['success'] else None,
+            seconds=round(time.monotonic() - started, 2),
+            reused=bool(result.get('reused_asset')),
+            error=result.get('error')
+        )
+        report(stage, percent=finished / total_scenes * 100)
+        return result
+
+    results = await asyncio.gather(*[
+        run_scene(i, broll) for i, broll in enumerate(broll_descriptions)
+    ])
+
+    broll_scenes = []
+    for i, (broll, result) in enumerate(zip(broll_descriptions, results)):
+        if result['success']:
+            broll.video_path = result['video_path']
+            if i != 0:
+                broll.static_description = result['static_description']
+            broll_scenes.append(broll)
+            print(f"✅ Scene {i+1} generated successfully")
+        else:
+            print(f"⚠️ Failed to generate scene {i+1}: {result['error']}")
+
+    print(f"\n✨ Generated {len(broll_scenes)}/{total_scenes} B-roll scenes successfully")
+    return broll_scenes
+
+
+async def normalize_broll_scenes(broll_scenes: List[BrollDescription], reference: Dict[str, Any]) -> List[BrollDescription]:
+    """Normalize already generated B-roll clips to the a-roll parameters, keeping the original clip on failure."""
+    async def normalize(broll):
+        normalized_path = f"{os.path.splitext(broll.video_path)[0]}_normalized.mp4"
+        try:
+            broll.video_path = await normalize_broll(broll.video_path, reference, normalized_path)
+        except Exception as e:
+            print(f"⚠️ Could not normalize {broll.video_path}, using the original clip: {str(e)}")
+
+    await asyncio.gather(*[normalize(broll) for broll in broll_scenes])
+    return broll_scenes
+
+
+async def merge_broll_scenes(
+    input_video_path: str,
+    broll_scenes: List[BrollDescription],
+    final_output_path: str,
+    subtitles_path: str = None
+) -> str:
+    """
+    Overlay the generated B-roll scenes on the input video, optionally burning in
+    an ASS subtitle file in the same pass.
+    """
+    # Convert broll scenes to format expected by ffmpeg_merge
+    print("\n📝 B-roll scenes to merge:")
+    for broll in broll_scenes:
+        print(f"  - Time: {broll.start:.2f}s to {broll.end:.2f}s")
+        print(f"    Video: {broll.video_path}")
+
+    broll_data = [
+        {
+            'start': broll.start,
+            'end': broll.end,
+            'video_path': broll.video_path
+        }
+        for broll in broll_scenes
+    ]
+
+    # Merge everything together
+    print("\n🎥 Merging final video...")
+    print(broll_data)
+    # Captions cover the whole video, so there is nothing left to stream-copy
+    if MERGE_MODE == "smart" and subtitles_path:
+        print("ℹ️ Burning in captions, smart render skipped: the whole video is re-encoded in one pass")
+    if MERGE_MODE == "smart" and not subtitles_path:
+        try:
+            await ffmpeg_smart_merge(
+                main_video=input_video_path,
+                broll_data=broll_data,
+                output_path=final_output_path,
+                work_dir=os.path.dirname(final_output_path) or None
+            )
+            return final_output_path
+        except Exception as e:
+            print(f"⚠️ Smart render failed, re-encoding the whole video: {str(e)}")
+    await ffmpeg_merge(
+        main_video=input_video_path,
+        broll_data=broll_data,
+        output_path=final_output_path,
+        subtitles_path=subtitles_path,
+        on_progress=ffmpeg_reporter("final_video")
+    )
+    return final_output_path
+
+
+async def generate_video_with_broll(
     input_video_path: str,
     output_dir: str = "output",
     final_output_name: str = "final_video.mp4",
-    product_image_b64: str = None
+    product_image: bytes = None
 ) -> Dict[str, Any]:
     """
     Generate a video with B-roll scenes from an input video.
@@ -48,78 +267,18 @@ def generate_video_with_broll(
         temp_dir = ensure_dir(os.path.join(output_dir, "temp"))
         broll_dir = ensure_dir(os.path.join(output_dir, "broll"))
         
-        # Extract audio from input video
-        print("\n🎵 Extracting audio...")
-        audio_path = os.path.join(temp_dir, "extracted_audio.wav")
-        extract_audio(input_video_path, audio_path)
-        
-        # Transcribe the audio
-        print("\n📝 Transcribing audio...")
-        transcript = transcribe_audio(audio_path)
+        transcript = await transcribe_video(input_video_path)
         
         # Generate B-roll descriptions
         print("\n✨ Generating B-roll descriptions...")
-        broll_descriptions = generate_all_brolls(transcript)
-        
-        # Generate each B-roll scene
-        broll_scenes = []
-        successful_scenes = 0
-        total_scenes = len(broll_descriptions)
-        
-        print(f"\n🎬 Generating {total_scenes} B-roll scenes...")
-        for i, broll in enumerate(broll_descriptions):
-            print(f"\n📽️ Scene {i+1}/{total_scenes}:")
-            print(f"Description: {broll.description[:100]}...")
-            
-            # Generate the scene
-            scene_path = os.path.join(broll_dir, f"broll_{i:03d}.mp4")
-            if i != 0:
-                result = generate_broll_scene(
-                    dynamic_description=broll.description,
-                    output_path=scene_path
-                )
-            else:
-                result = generate_broll_for_product(
-                    dynamic_description=broll.description,
-                    output_path=scene_path,
-                    product_image_b64=product_image_b64
-                )
-            
-            if result['success']:
-                broll.video_path = result['video_path']
-                if i != 0:
-                    broll.static_description = result['static_description']
-                broll_scenes.append(broll)
-                successful_scenes += 1
-                print(f"✅ Scene {i+1} generated successfully")
-            else:
-                print(f"⚠️ Failed to generate scene {i+1}: {result['error']}")
-        
-        print(f"\n✨ Generated {successful_scenes}/{total_scenes} B-roll scenes successfully")
+        broll_descriptions = await run_blocking(generate_all_brolls, transcript)
         
-        # Convert broll scenes to format expected by ffmpeg_merge
-        print("\n📝 B-roll scenes to merge:")
-        for broll in broll_scenes:
-            print(f"  - Time: {broll.start:.2f}s to {broll.end:.2f}s")
-            print(f"    Video: {broll.video_path}")
+        broll_scenes = await generate_broll_scenes(broll_descriptions, broll_dir, product_image)
         
-        broll_data = [
-            {
-                'start': broll.start,
-                'end': broll.end,
-                'video_path': broll.video_path
-            }
-            for broll in broll_scenes
-        ]
-        
-        # Merge everything together
-        print("\n🎥 Merging final video...")
-        final_output_path = os.path.join(output_dir, final_output_name)
-        print(broll_data)
-        ffmpeg_merge(
-            main_video=input_video_path,
-            broll_data=broll_data,
-            output_path=final_output_path
+        final_output_path = await merge_broll_scenes(
+            input_video_path,
+            broll_scenes,
+            os.path.join(output_dir, final_output_name)
         )
         
         return {
@@ -151,64 +310,194 @@ def ensure_unique_output_dir():
     return path
 
 
-async def fetch_image_as_base64(url: str) -> str:
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            if response.status != 200:
-                raise ValueError(f"Failed to fetch image from {url}")
-            image_bytes = await response.read()
-            return base64.b64encode(image_bytes).decode("utf-8")
+def job_output_dir(job_id: str) -> str:
+    """Output directory of a job, the same for every run of that job id."""
+    if not re.fullmatch(r"[A-Za-z0-9_-]+", job_id):
+        raise ValueError(f"Invalid job id: {job_id}")
+    return os.path.join(OUTPUT_DIR, "jobs", job_id)
 
 
-async def orchestrate(info: dict):
-    # 1. Generate script
-    generator = GenerateScript(info)
-    script = await generator.generate()
-    
-    # Create a unique output directory for this request
-    unique_output_dir = ensure_unique_output_dir()
+async def fetch_image(url: str) -> bytes:
+    session = get_aiohttp_session()
+    async with session.get(url) as response:
+        if response.status != 200:
+            raise ValueError(f"Failed to fetch image from {url}")
+        return await response.read()
 
-    # 2. Generate avatar video
-    avatar_video_path = os.path.join(unique_output_dir, "demo_video.mp4")
-    generate_avatar_video(
-        avatar_id="046b2b11e4424b5c81f8d0223d3281d5",
-        input_text=script,
-        output_name=avatar_video_path,
-        voice_speed=1.1
-    )
 
+async def orchestrate(info: dict, job_id: str = None):
+    """
+    Run the whole video pipeline for one request.
+    With a job_id, the job writes into its own directory and records finished stages
+    in a manifest there, so running the same job id again resumes after the last
+    completed stage.
+    """
     product_image_url = info.get("productImage")
     if not product_image_url:
         raise KeyError("Missing 'productImage' URL in info")
 
-    product_image_b64 = await fetch_image_as_base64(product_image_url)
+    manifest = None
+    if job_id:
+        unique_output_dir = await run_blocking(ensure_dir, job_output_dir(job_id))
+        if CHECKPOINTS_ENABLED:
+            manifest = await run_blocking(JobManifest, unique_output_dir, job_id, info)
+    else:
+        # Create a unique output directory for this request
+        unique_output_dir = await run_blocking(ensure_unique_output_dir)
+    temp_dir = ensure_dir(os.path.join(unique_output_dir, "temp"))
+    broll_dir = ensure_dir(os.path.join(unique_output_dir, "broll"))
+
+    # 1. Generate script
+    async def script_stage():
+        generator = GenerateScript(info)
+        return await generator.generate()
+
+    # 2. Generate avatar video
+    async def avatar_stage(script):
+        avatar_video_path = os.path.join(unique_output_dir, "demo_video.mp4")
+        avatar = await generate_avatar_video(
+            avatar_id=AVATAR_ID,
+            input_text=script,
+            output_name=avatar_video_path,
+            voice_speed=AVATAR_VOICE_SPEED
+        )
+        if not avatar.get('success'):
+            raise Exception(f"Avatar generation failed: {avatar.get('error')}")
+        return avatar_video_path
+
+    # The product image does not depend on anything, fetch it while the script renders
+    async def product_image_stage():
+        return await fetch_image(product_image_url)
 
     # 3. Generate b-roll-enhanced final video
-    result = generate_video_with_broll(
-        input_video_path=avatar_video_path,
-        output_dir=unique_output_dir,
-        final_output_name="final_video.mp4",
-        product_image_b64=product_image_b64
-    )
+    async def transcript_stage(avatar, script):
+        if TIMESTAMP_MODE == "align":
+            return await align_video(avatar, script, info.get("language"))
+        return await transcribe_video(avatar, info.get("language"))
 
-    if not result.get("success"):
-        print("❌ Failed to generate final video:", result.get("error"))
-        return result
+    async def broll_plan_stage(transcript):
+        print("\n✨ Generating B-roll descriptions...")
+        return await run_blocking(generate_all_brolls, transcript)
+
+    async def merge_reference(avatar):
+        # Clips only need the a-roll's encoding when the merge stream-copies around them
+        if MERGE_MODE != "smart" or CAPTIONS_MODE == "local":
+            return None
+        try:
+            return await probe_video(avatar)
+        except Exception as e:
+            print(f"⚠️ Could not probe the avatar video, B-roll clips will not be normalized: {str(e)}")
+            return None
+
+    async def brolls_stage(broll_plan, product_image, avatar):
+        reference = await merge_reference(avatar)
+        return await generate_broll_scenes(broll_plan, broll_dir, product_image, reference)
+
+    # Speculative mode: plan and render B-roll from estimated timings while HeyGen renders
+    async def estimated_transcript_stage(script):
+        return await run_blocking(estimate_script_timings, script, AVATAR_VOICE_SPEED)
+
+    async def speculative_plan_stage(estimated_transcript):
+        print("\n✨ Planning B-roll from estimated script timings...")
+        return await run_blocking(generate_all_brolls, estimated_transcript)
+
+    async def speculative_brolls_stage(speculative_plan, product_image):
+        return await generate_broll_scenes(speculative_plan, broll_dir, product_image, stage="speculative_brolls")
+
+    async def snapped_brolls_stage(speculative_brolls, estimated_transcript, transcript, product_image, avatar):
+        brolls = snap_broll_windows(speculative_brolls, estimated_transcript, transcript, SPECULATIVE_MAX_DRIFT)
+        reference = await merge_reference(avatar)
+        if brolls is None:
+            broll_plan = await broll_plan_stage(transcript)
+            return await generate_broll_scenes(broll_plan, broll_dir, product_image, reference)
+        print(f"\n📐 Moved {len(brolls)} speculative B-roll scenes onto the real timings")
+        if reference is not None:
+            await normalize_broll_scenes(brolls, reference)
+        return brolls
+
+    async def final_video_stage(avatar, brolls, transcript):
+        if CAPTIONS_MODE == "local":
+            # Render the captions from the timed segments and burn them in while merging
+            print("\n🎞️ Rendering captions...")
+            subtitles_path = await run_blocking(
+                build_ass, transcript, os.path.join(temp_dir, "captions.ass")
+            )
+            final_output_path = os.path.join(unique_output_dir, "captioned_video.mp4")
+            return await merge_broll_scenes(avatar, brolls, final_output_path, subtitles_path)
+        final_output_path = os.path.join(unique_output_dir, "final_video.mp4")
+        return await merge_broll_scenes(avatar, brolls, final_output_path)
 
     # 4. Add captions with ZapCap
-    try:
+    async def captions_stage(final_video):
+        if CAPTIONS_MODE == "local":
+            # Already burned in by the merge
+            return final_video
         print("\n🎞️ Adding captions via ZapCap...")
         caption_generator = ZapCapCaptionGenerator()
-        input_vid = result['final_video']
         output_vid = os.path.join(unique_output_dir, "captioned_video.mp4")
         template_id = 'd2018215-2125-41c1-940e-f13b411fff5c'  # your template ID
-        caption_generator.add_captions(input_vid, template_id, output_vid)
+        await caption_generator.add_captions(final_video, template_id, output_vid)
         print("✅ Captioned video saved to:", output_vid)
-        result["captioned_video"] = output_vid
-    except Exception as e:
-        print("❌ Failed to add captions:", str(e))
-        result["captioning_error"] = str(e)
+        return output_vid
+
+    if SPECULATIVE_BROLL:
+        broll_stages = [
+            Stage("estimated_transcript", estimated_transcript_stage, deps=["script"]),
+            Stage("speculative_plan", speculative_plan_stage, deps=["estimated_transcript"]),
+            Stage("speculative_brolls", speculative_brolls_stage, deps=["speculative_plan", "product_image"]),
+            Stage(
+                "brolls",
+                snapped_brolls_stage,
+                deps=["speculative_brolls", "estimated_transcript", "transcript", "product_image", "avatar"]
+            ),
+        ]
+    else:
+        broll_stages = [
+            Stage("broll_plan", broll_plan_stage, deps=["transcript"]),
+            Stage("brolls", brolls_stage, deps=["broll_plan", "product_image", "avatar"]),
+        ]
 
+    pipeline = Pipeline([
+        Stage("script", script_stage),
+        Stage("avatar", avatar_stage, deps=["script"]),
+        # Cheap to fetch again and too large for the manifest
+        Stage("product_image", product_image_stage, checkpoint=False),
+        Stage("transcript", transcript_stage, deps=["avatar", "script"]),
+        *broll_stages,
+        Stage("final_video", final_video_stage, deps=["avatar", "brolls", "transcript"]),
+        Stage("captioned_video", captions_stage, deps=["final_video"]),
+    ], manifest=manifest)
+
+    try:
+        outputs = await pipeline.run()
+    except StageError as e:
+        if e.stage != "captioned_video":
+            print("❌ Failed to generate final video:", str(e.error))
+            return {
+                'success': False,
+                'error': str(e.error),
+                'failed_stage': e.stage
+            }
+        # Captioning failed, keep the uncaptioned result
+        print("❌ Failed to add captions:", str(e.error))
+        outputs = dict(pipeline.results)
+        outputs["captioning_error"] = str(e.error)
+
+    result = {
+        'success': True,
+        'input_video': outputs["avatar"],
+        'final_video': outputs["final_video"],
+        'transcript': outputs["transcript"],
+        'broll_scenes': outputs["brolls"],
+        'temp_dir': temp_dir,
+        'broll_dir': broll_dir,
+        'stage_timings': pipeline.timings,
+        'restored_stages': pipeline.restored
+    }
+    if outputs.get("captioned_video"):
+        result["captioned_video"] = outputs["captioned_video"]
+    if outputs.get("captioning_error"):
+        result["captioning_error"] = outputs["captioning_error"]
     return result
 
 
@@ -223,9 +512,8 @@ if __name__ == "__main__":
         "target_audience": "Health-conscious individuals, young families, and eco-friendly apartment dwellers aged 28–45"
     }
 
-    with open("./breezenest.png", "rb") as image_file:
-        encoded_string = base64.b64encode(image_file.read()).decode("utf-8")
-        info["product_image_b64"] = encoded_string
+    # Any publicly reachable image of the product
+    info["productImage"] = "https://example.com/breezenest.png"
 
 
     result = asyncio.run(orchestrate(info))
@@ -1,30 +1,53 @@
+import asyncio
+import math
 import os
+import re
 import time
 import json
-import requests
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from pathlib import Path
 from dotenv import load_dotenv
+from agents_server.avatar_cache import avatar_cache_key, get_avatar_cache
+from agents_server.clients import get_http_session
+from agents_server.concurrency import run_blocking, provider_limit
+from agents_server.downloads import download_file
+from agents_server.ffmpeg.wrapper import ffmpeg_concat_clips
+from agents_server.polling import poll_until
+from agents_server import webhooks
 
 load_dotenv()
 
+DEFAULT_VOICE_ID = '9e18bbe8306c43da9fd1f598289b03ca'
+# 9:16 portrait ratio
+VIDEO_WIDTH = 720
+VIDEO_HEIGHT = 1280
+# Scripts longer than this many words are rendered as concurrent segments, 0 renders in one piece.
+# Well above the ~30 second (75-90 word) scripts the generator writes, so normal videos have no seams.
+AVATAR_SEGMENT_WORDS = int(os.getenv("AVATAR_SEGMENT_WORDS", "200"))
+# Upper bound on the segments of one script
+AVATAR_MAX_SEGMENTS = int(os.getenv("AVATAR_MAX_SEGMENTS", "4"))
+
+# Avatar renders in flight, keyed by cache key, so identical requests wait for one render
+_pending_renders: Dict[str, asyncio.Future] = {}
+
 class HeyGenVideoGenerator:
     def __init__(self):
         self.api_key = os.getenv('HEYGEN_API_KEY')
         if not self.api_key:
             raise ValueError('HEYGEN_API_KEY not found in environment variables')
     
-        self.base_url = 'https://api.heygen.com'
+        self.base_url = os.getenv('HEYGEN_API_BASE', 'https://api.heygen.com').rstrip('/')
         self.headers = {
             'X-Api-Key': self.api_key,
             'Content-Type': 'application/json'
         }
+        self.session = get_http_session()
     
-    def generate_video(
+    async def generate_video(
         self,
         avatar_id: str,
         input_text: str,
-        voice_id: str = '9e18bbe8306c43da9fd1f598289b03ca',  # Default voice
+        voice_id: str = DEFAULT_VOICE_ID,
         avatar_style: str = 'normal',
         voice_speed: float = 1.0,
         output_path: Optional[str] = None
@@ -65,10 +88,14 @@ class HeyGenVideoGenerator:
                     }
                 ],
                 "dimension": {
-                    "width": 720,
-                    "height": 1280  # 9:16 portrait ratio
+                    "width": VIDEO_WIDTH,
+                    "height": VIDEO_HEIGHT
                 }
             }
+            # HeyGen calls this when the render finishes, so the poller is woken early
+            callback_url = webhooks.callback_url('heygen')
+            if callback_url:
+                payload["callback_url"] = callback_url
             
             # Print request details
             request_url = f"{self.base_url}/v2/video/generate"
@@ -78,7 +105,8 @@ class HeyGenVideoGenerator:
             print(f"Payload: {json.dumps(payload, indent=2)}")
             
             # Initialize video generation
-            response = requests.post(
+            response = await run_blocking(
+                self.session.post,
                 request_url,
                 headers=self.headers,
                 json=payload
@@ -107,33 +135,31 @@ class HeyGenVideoGenerator:
             video_id = data['data']['video_id']
             
             # Poll for video completion
-            while True:
-                status = self._check_video_status(video_id)
-                if status.get('status') == 'completed':
-                    break
-                elif status.get('status') == 'failed':
-                    return {
-                        'success': False,
-                        'error': f'Video generation failed: {status.get("error", "Unknown error")}',
-                        'video_path': None,
-                        'video_id': video_id
-                    }
-                time.sleep(5)  # Wait 5 seconds before checking again
+            wake = webhooks.expect('heygen', video_id)
+            try:
+                status = await poll_until(
+                    'heygen',
+                    lambda: self._check_video_status(video_id),
+                    lambda status: status.get('status') in ('completed', 'failed'),
+                    task_id=video_id,
+                    wake=wake
+                )
+            finally:
+                webhooks.forget('heygen', video_id)
+            if status.get('status') == 'failed':
+                return {
+                    'success': False,
+                    'error': f'Video generation failed: {status.get("error", "Unknown error")}',
+                    'video_path': None,
+                    'video_id': video_id
+                }
             
             # Download the video if output_path is provided
             if output_path and status.get('video_url'):
                 video_url = status['video_url']
-                response = requests.get(video_url)
-                response.raise_for_status()
-                
-                # Ensure output directory exists
-                output_dir = os.path.dirname(output_path)
-                if output_dir:
-                    Path(output_dir).mkdir(parents=True, exist_ok=True)
                 
-                # Save the video
-                with open(output_path, 'wb') as f:
-                    f.write(response.content)
+                # Stream the video to disk
+                await run_blocking(download_file, video_url, output_path, session=self.session)
                 
                 return {
                     'success': True,
@@ -168,8 +194,8 @@ class HeyGenVideoGenerator:
         Returns:
             Dict containing status information
         """
-        status_url = "https://api.heygen.com/v1/video_status.get"
-        response = requests.get(
+        status_url = f"{self.base_url}/v1/video_status.get"
+        response = self.session.get(
             status_url,
             headers=self.headers,
             params={'video_id': video_id}
@@ -177,17 +203,58 @@ class HeyGenVideoGenerator:
         response.raise_for_status()
         return response.json().get('data', {})
 
-def generate_avatar_video(
+def split_script_chunks(
+    text: str,
+    max_words: int = AVATAR_SEGMENT_WORDS,
+    max_chunks: int = AVATAR_MAX_SEGMENTS
+) -> List[str]:
+    """Split a script at sentence boundaries into chunks of roughly equal length.
+
+    Args:
+        text (str): Script to split
+        max_words (int): Target words per chunk, 0 keeps the script whole
+        max_chunks (int): Upper bound on the number of chunks
+
+    Returns:
+        List of chunks, a single one if the script is short enough
+    """
+    sentences = [" ".join(s.split()) for s in re.split(r"(?<=[.!?])\s+|(?<=[.!?][\"”])\s+|\n+", text)]
+    sentences = [s for s in sentences if s]
+    total = sum(len(s.split()) for s in sentences)
+    if max_words <= 0 or total <= max_words:
+        return [text]
+    count = min(max_chunks, math.ceil(total / max_words), len(sentences))
+    if count <= 1:
+        return [text]
+
+    chunks, current, words = [], [], 0
+    for sentence in sentences:
+        current.append(sentence)
+        words += len(sentence.split())
+        # Close the chunk at the first sentence that reaches its share of the script
+        if len(chunks) < count - 1 and words >= total * (len(chunks) + 1) / count:
+            chunks.append(" ".join(current))
+            current = []
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+async def generate_avatar_video(
     avatar_id: str,
     input_text: str,
     output_name: Optional[str] = None,
+    segmented: bool = True,
     **kwargs
 ) -> Dict[str, Any]:
-    """Convenience function to generate a video using HeyGen and save it to a given path."""
+    """Convenience function to generate a video using HeyGen and save it to a given path.
 
-    try:
-        generator = HeyGenVideoGenerator()
+    Renders are cached by avatar, voice, speed, dimensions and script, so an identical
+    request is served from the avatar cache without calling HeyGen. Long scripts are
+    rendered as concurrent segments (see split_script_chunks) unless segmented is False.
+    """
 
+    try:
         # If no output path is given, generate a default one
         if output_name is None:
             BASE_DIR = "/app"
@@ -198,12 +265,50 @@ def generate_avatar_video(
             # Ensure the directory exists
             Path(os.path.dirname(output_name)).mkdir(parents=True, exist_ok=True)
 
-        return generator.generate_video(
-            avatar_id=avatar_id,
-            input_text=input_text,
-            output_path=output_name,
-            **kwargs
+        if segmented:
+            chunks = split_script_chunks(input_text)
+            if len(chunks) > 1:
+                return await _generate_segmented_video(avatar_id, chunks, output_name, **kwargs)
+
+        cache = get_avatar_cache()
+        if cache is None:
+            return await _render_avatar_video(avatar_id, input_text, output_name, **kwargs)
+
+        key = avatar_cache_key(
+            avatar_id,
+            kwargs.get('voice_id', DEFAULT_VOICE_ID),
+            kwargs.get('voice_speed', 1.0),
+            VIDEO_WIDTH,
+            VIDEO_HEIGHT,
+            input_text,
+            kwargs.get('avatar_style', 'normal')
         )
+        while key in _pending_renders:
+            print("⏳ Identical avatar render in progress, waiting for it...")
+            await asyncio.shield(_pending_renders[key])
+
+        future = asyncio.get_running_loop().create_future()
+        _pending_renders[key] = future
+        try:
+            if await run_blocking(cache.get, key, output_name):
+                return {
+                    'success': True,
+                    'video_path': output_name,
+                    'error': None,
+                    'video_id': None,
+                    'cached': True
+                }
+
+            result = await _render_avatar_video(avatar_id, input_text, output_name, **kwargs)
+            if result.get('success') and result.get('video_path'):
+                try:
+                    await run_blocking(cache.put, key, result['video_path'])
+                except Exception as e:
+                    print(f"⚠️ Could not cache avatar video: {str(e)}")
+            return result
+        finally:
+            _pending_renders.pop(key, None)
+            future.set_result(None)
 
     except Exception as e:
         return {
@@ -214,6 +319,50 @@ def generate_avatar_video(
         }
 
 
+async def _render_avatar_video(avatar_id: str, input_text: str, output_name: str, **kwargs) -> Dict[str, Any]:
+    generator = HeyGenVideoGenerator()
+    async with provider_limit("heygen"):
+        return await generator.generate_video(
+            avatar_id=avatar_id,
+            input_text=input_text,
+            output_path=output_name,
+            **kwargs
+        )
+
+
+async def _generate_segmented_video(avatar_id: str, chunks: List[str], output_name: str, **kwargs) -> Dict[str, Any]:
+    """Render every chunk as its own HeyGen video at the same time and join them in order."""
+    print(f"✂️ Rendering the avatar video as {len(chunks)} segments")
+    base, _ = os.path.splitext(output_name)
+    part_paths = [f"{base}_part{idx}.mp4" for idx in range(len(chunks))]
+    results = await asyncio.gather(*(
+        generate_avatar_video(avatar_id, chunk, part_path, segmented=False, **kwargs)
+        for chunk, part_path in zip(chunks, part_paths)
+    ))
+    try:
+        failed = [(idx, r.get('error')) for idx, r in enumerate(results) if not r.get('success')]
+        if failed:
+            return {
+                'success': False,
+                'error': '; '.join(f'Segment {idx}: {error}' for idx, error in failed),
+                'video_path': None,
+                'video_id': None
+            }
+
+        await ffmpeg_concat_clips(part_paths, output_name)
+        return {
+            'success': True,
+            'video_path': output_name,
+            'error': None,
+            'video_id': None,
+            'segment_ids': [r.get('video_id') for r in results]
+        }
+    finally:
+        for part_path in part_paths:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+
 def main():
     # Example usage
     avatar_id = "046b2b11e4424b5c81f8d0223d3281d5"  # This would come from LLM in real use
@@ -231,12 +380,12 @@ def main():
                     "Join the movement. Elevate your style with LuxeStride Eco Sneakers today. Shop now."
                  """  
     
-    result = generate_avatar_video(
+    result = asyncio.run(generate_avatar_video(
         avatar_id=avatar_id,
         input_text=input_text,
         output_name='demo_video',
         voice_speed=1.1
-    )
+    ))
     
     if result['success']:
         print(f"✨ Video generated successfully!")
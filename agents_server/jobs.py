@@ -0,0 +1,236 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from agents_server.progress import ProgressBus, report, reset_bus, use_bus
+
+# Number of jobs a single replica runs at the same time
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# Maximum number of queued jobs (0 means unbounded)
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "0"))
+# How many finished jobs are kept around for GET /api/jobs/{id}
+JOB_HISTORY_LIMIT = int(os.getenv("JOB_HISTORY_LIMIT", "1000"))
+# Seconds a request is de-duplicated against an earlier one with the same idempotency key
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))
+# Set to 0 to only de-duplicate requests that send an Idempotency-Key header
+IDEMPOTENCY_FROM_PAYLOAD = os.getenv("IDEMPOTENCY_FROM_PAYLOAD", "1") == "1"
+
+# Called with the job payload and the job id
+JobHandler = Callable[[Dict[str, Any], str], Awaitable[Dict[str, Any]]]
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, dict):
+        return {str(key): _normalize(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_normalize(item) for item in value]
+    return value
+
+
+def idempotency_key(payload: Dict[str, Any], header: Optional[str] = None) -> Optional[str]:
+    """Key identifying repeats of one request: the client's header, or a hash of the normalized payload.
+
+    Returns None when there is no header and payload keys are turned off.
+    """
+    if header:
+        return f"header:{header.strip()}"
+    if not IDEMPOTENCY_FROM_PAYLOAD:
+        return None
+    normalized = json.dumps(_normalize(payload), sort_keys=True, ensure_ascii=False, default=str)
+    return f"payload:{hashlib.sha256(normalized.encode('utf-8')).hexdigest()}"
+
+
+class Job:
+    def __init__(self, payload: Dict[str, Any], job_id: Optional[str] = None):
+        self.id = job_id or uuid.uuid4().hex
+        self.payload = payload
+        self.status = "queued"  # queued, running, completed, failed
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = _now()
+        self.started_at: Optional[str] = None
+        self.finished_at: Optional[str] = None
+        self.attempts = 0
+        # Progress events of the current attempt
+        self.progress = ProgressBus(self.id)
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "jobId": self.id,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "createdAt": self.created_at,
+            "startedAt": self.started_at,
+            "finishedAt": self.finished_at,
+            "attempts": self.attempts,
+        }
+
+
+class JobManager:
+    """In-process job queue drained by a fixed pool of asyncio workers."""
+
+    def __init__(self, handler: JobHandler, workers: int = JOB_WORKERS, max_queue: int = JOB_QUEUE_SIZE):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        # Idempotency key -> (job id, time.monotonic() of the first submission)
+        self.keys: Dict[str, Tuple[str, float]] = {}
+        self._tasks = []
+
+    async def start(self):
+        """Spawn the worker pool. Must be called from the running event loop."""
+        if self._tasks:
+            return
+        for index in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(index)))
+        print(f"🧵 Started {self.workers} job workers")
+
+    async def stop(self):
+        """Cancel the worker pool, e.g. on application shutdown."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, payload: Dict[str, Any]) -> Job:
+        """Queue a new job and return it immediately.
+
+        Raises:
+            asyncio.QueueFull: If the queue is bounded and already full
+        """
+        job = Job(payload)
+        self.queue.put_nowait(job)
+        self.jobs[job.id] = job
+        self._evict_finished()
+        return job
+
+    def submit_once(self, payload: Dict[str, Any], key: Optional[str] = None) -> Tuple[Job, bool]:
+        """Queue a job unless one with the same idempotency key was submitted within IDEMPOTENCY_TTL.
+
+        A repeat of a queued, running or completed job returns that job. A repeat of a
+        failed job retries it, resuming from its checkpoints.
+
+        Returns:
+            (job, duplicate) where duplicate is True if no new job was created
+
+        Raises:
+            asyncio.QueueFull: If the queue is bounded and already full
+        """
+        entry = self.keys.get(key) if key else None
+        if entry is not None and time.monotonic() - entry[1] <= IDEMPOTENCY_TTL and entry[0] in self.jobs:
+            job = self.jobs[entry[0]]
+            if job.status == "failed":
+                print(f"🔁 Repeated request for failed job {job.id}, retrying it")
+                return self.retry(job.id), True
+            print(f"🔁 Repeated request joined job {job.id} ({job.status})")
+            return job, True
+
+        job = self.submit(payload)
+        if key:
+            self.keys[key] = (job.id, time.monotonic())
+        return job, False
+
+    def retry(self, job_id: str, payload: Optional[Dict[str, Any]] = None) -> Optional[Job]:
+        """Run a job again under the same id, so it resumes from its checkpoints.
+
+        Only failed jobs run again: a queued, running or completed job is returned as is,
+        so a completed job keeps its videoUrl. A job unknown to this process, e.g. after a
+        restart, is recreated from payload. Returns None if the job is unknown and no
+        payload is given.
+
+        Raises:
+            asyncio.QueueFull: If the queue is bounded and already full
+        """
+        job = self.jobs.get(job_id)
+        if job is not None and job.status != "failed":
+            return job
+        if job is None:
+            if payload is None:
+                return None
+            job = Job(payload, job_id)
+        self.queue.put_nowait(job)
+        if job.progress.closed:
+            # Continue the ids of the previous run so Last-Event-ID stays valid across retries
+            job.progress = ProgressBus(job.id, first_id=job.progress.last_id + 1)
+        job.status = "queued"
+        job.result = None
+        job.error = None
+        job.started_at = None
+        job.finished_at = None
+        self.jobs[job.id] = job
+        self.jobs.move_to_end(job.id)
+        self._evict_finished()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def _evict_finished(self):
+        # Drop the oldest finished jobs once the history grows too large
+        excess = len(self.jobs) - JOB_HISTORY_LIMIT
+        if excess <= 0:
+            return
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.done][:excess]:
+            del self.jobs[job_id]
+        now = time.monotonic()
+        for key, (job_id, submitted) in list(self.keys.items()):
+            if job_id not in self.jobs or now - submitted > IDEMPOTENCY_TTL:
+                del self.keys[key]
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self.queue.get()
+            job.status = "running"
+            job.started_at = _now()
+            job.attempts += 1
+            print(f"🚀 Worker {index} picked up job {job.id}")
+            token = use_bus(job.progress)
+            report("job", "started", 0.0, attempt=job.attempts)
+            try:
+                result = await self.handler(job.payload, job.id)
+                job.result = result
+                if result.get("status"):
+                    job.status = "completed"
+                else:
+                    job.status = "failed"
+                    job.error = result.get("error", "Unknown error")
+            except asyncio.CancelledError:
+                job.status = "failed"
+                job.error = "Job cancelled"
+                raise
+            except Exception as e:
+                traceback.print_exc()
+                job.status = "failed"
+                job.error = str(e)
+            finally:
+                job.finished_at = _now()
+                report(
+                    "job",
+                    job.status,
+                    100.0 if job.status == "completed" else None,
+                    error=job.error,
+                    videoUrl=(job.result or {}).get("videoUrl")
+                )
+                job.progress.close()
+                reset_bus(token)
+                self.queue.task_done()
+            print(f"🏁 Job {job.id} finished with status: {job.status}")
@@ -0,0 +1,200 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+from pydantic import BaseModel
+
+from agents_server.concurrency import run_blocking
+
+# Set to 0 to send every LLM call to the API
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+# Seconds a response stays valid, override per agent with e.g. LLM_CACHE_TTL_RESEARCH=86400
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(6 * 3600)))
+# Responses kept in process memory
+LLM_CACHE_MEMORY_ITEMS = int(os.getenv("LLM_CACHE_MEMORY_ITEMS", "512"))
+# SQLite file shared by the workers on a node, the disk tier is off when empty
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "/app/output/llm_cache.sqlite")
+# Comma-separated agents that always call the API, e.g. "script,evaluator"
+LLM_CACHE_SKIP = {name.strip() for name in os.getenv("LLM_CACHE_SKIP", "").split(",") if name.strip()}
+
+# Expired rows are purged from SQLite after this many writes
+PURGE_EVERY = 100
+
+
+def agent_ttl(agent: str) -> float:
+    return float(os.getenv(f"LLM_CACHE_TTL_{agent.upper()}", str(LLM_CACHE_TTL)))
+
+
+def cache_enabled(agent: str) -> bool:
+    return LLM_CACHE_ENABLED and agent not in LLM_CACHE_SKIP
+
+
+def make_key(agent: str, model: str, prompt: Any, schema: Optional[type] = None, **params) -> str:
+    """Hash of everything that determines a response: model, prompt, output schema and sampling params."""
+    payload = {
+        "agent": agent,
+        "model": model,
+        "prompt": prompt,
+        "schema": schema.model_json_schema() if schema is not None and issubclass(schema, BaseModel) else None,
+        "params": params,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """In-memory LRU in front of an optional SQLite table. Values are JSON strings."""
+
+    def __init__(self, path: str = LLM_CACHE_PATH, memory_items: int = LLM_CACHE_MEMORY_ITEMS):
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._memory_items = memory_items
+        self._writes = 0
+        self._db = None
+        if path:
+            try:
+                directory = os.path.dirname(path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._db = sqlite3.connect(path, check_same_thread=False, timeout=5)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)"
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                print(f"⚠️ LLM cache database unavailable, using memory only: {str(e)}")
+                self._db = None
+
+    def _remember(self, key: str, value: str, expires: float):
+        self._memory[key] = (value, expires)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._memory.move_to_end(key)
+                    return entry[0]
+                del self._memory[key]
+            if self._db is None:
+                return None
+            try:
+                row = self._db.execute(
+                    "SELECT value, expires FROM responses WHERE key = ? AND expires > ?", (key, now)
+                ).fetchone()
+            except sqlite3.Error as e:
+                print(f"⚠️ LLM cache read failed: {str(e)}")
+                return None
+            if row is None:
+                return None
+            self._remember(key, row[0], row[1])
+            return row[0]
+
+    def set(self, key: str, value: str, ttl: float):
+        expires = time.time() + ttl
+        with self._lock:
+            self._remember(key, value, expires)
+            if self._db is None:
+                return
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, expires) VALUES (?, ?, ?)", (key, value, expires)
+                )
+                self._writes += 1
+                if self._writes % PURGE_EVERY == 0:
+                    self._db.execute("DELETE FROM responses WHERE expires <= ?", (time.time(),))
+                self._db.commit()
+            except sqlite3.Error as e:
+                print(f"⚠️ LLM cache write failed: {str(e)}")
+
+
+_cache: Optional[LLMCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache()
+        return _cache
+
+
+def _encode(value: Any) -> str:
+    if isinstance(value, BaseModel):
+        return value.model_dump_json()
+    return json.dumps(value)
+
+
+def _decode(raw: str, schema: Optional[type]) -> Any:
+    if schema is not None and issubclass(schema, BaseModel):
+        return schema.model_validate_json(raw)
+    return json.loads(raw)
+
+
+def cached_call(
+    agent: str,
+    model: str,
+    prompt: Any,
+    compute: Callable[[], Any],
+    schema: Optional[type] = None,
+    **params
+) -> Any:
+    """Return the cached response for this call, or run compute() and cache its result.
+
+    Args:
+        agent (str): Name used for opt-out (LLM_CACHE_SKIP) and TTL overrides
+        model (str): Model name, part of the key
+        prompt: Messages or prompt text, anything JSON-serializable, part of the key
+        compute (callable): Makes the actual API call
+        schema (BaseModel subclass, optional): Structured output type, part of the key
+        **params: Other settings that change the response, e.g. temperature
+
+    Returns:
+        The response, a schema instance when a schema is given
+    """
+    if not cache_enabled(agent):
+        return compute()
+    cache = get_llm_cache()
+    key = make_key(agent, model, prompt, schema, **params)
+    raw = cache.get(key)
+    if raw is not None:
+        print(f"💾 LLM cache hit: {agent}")
+        return _decode(raw, schema)
+    value = compute()
+    # Refusals and empty outputs are not worth keeping
+    if value is not None:
+        cache.set(key, _encode(value), agent_ttl(agent))
+    return value
+
+
+async def cached_call_async(
+    agent: str,
+    model: str,
+    prompt: Any,
+    compute: Callable[[], Awaitable[Any]],
+    schema: Optional[type] = None,
+    **params
+) -> Any:
+    """Async variant of cached_call, compute is a coroutine function."""
+    if not cache_enabled(agent):
+        return await compute()
+    cache = get_llm_cache()
+    key = make_key(agent, model, prompt, schema, **params)
+    raw = await run_blocking(cache.get, key)
+    if raw is not None:
+        print(f"💾 LLM cache hit: {agent}")
+        return _decode(raw, schema)
+    value = await compute()
+    if value is not None:
+        await run_blocking(cache.set, key, _encode(value), agent_ttl(agent))
+    return value
@@ -0,0 +1,138 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from agents_server.checkpoints import JobManifest
+from agents_server.concurrency import run_blocking
+from agents_server.progress import report
+
+StageFunc = Callable[..., Awaitable[Any]]
+
+
+class StageError(Exception):
+    """Raised when a pipeline stage fails. Keeps the name of the failing stage."""
+
+    def __init__(self, stage: str, error: BaseException):
+        super().__init__(f"Stage '{stage}' failed: {error}")
+        self.stage = stage
+        self.error = error
+
+
+class Stage:
+    def __init__(self, name: str, func: StageFunc, deps: Iterable[str] = (), checkpoint: bool = True):
+        """A single node of the pipeline graph.
+
+        Args:
+            name (str): Unique stage name, also the key of its result
+            func (callable): Async function called with one keyword argument per dependency
+            deps (list): Names of the stages whose results this stage needs
+            checkpoint (bool): Record the result in the job manifest so a rerun can skip the stage
+        """
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        self.checkpoint = checkpoint
+
+
+class Pipeline:
+    """Run a graph of async stages, starting each one as soon as its inputs are ready."""
+
+    def __init__(self, stages: List[Stage], manifest: Optional[JobManifest] = None):
+        self.manifest = manifest
+        self.stages: Dict[str, Stage] = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f"Duplicate stage: {stage.name}")
+            self.stages[stage.name] = stage
+        self.order = self._topological_order()
+        self.timings: Dict[str, float] = {}
+        # Results of the stages that completed, also filled when the run fails
+        self.results: Dict[str, Any] = {}
+        # Stages whose result was taken from the manifest
+        self.restored: List[str] = []
+
+    def _topological_order(self) -> List[str]:
+        order: List[str] = []
+        state: Dict[str, str] = {}
+
+        def visit(name: str, path: List[str]):
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise ValueError(f"Cycle in pipeline: {' -> '.join(path + [name])}")
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage '{name}' required by '{path[-1]}'")
+            state[name] = "visiting"
+            for dep in self.stages[name].deps:
+                visit(dep, path + [name])
+            state[name] = "done"
+            order.append(name)
+
+        for name in self.stages:
+            visit(name, [])
+        return order
+
+    async def _run_stage(self, stage: Stage, tasks: Dict[str, "asyncio.Task"]) -> Any:
+        inputs = {dep: await tasks[dep] for dep in stage.deps}
+        manifest = self.manifest if stage.checkpoint else None
+        if manifest is not None:
+            found, result = await run_blocking(manifest.restore, stage.name, inputs)
+            if found:
+                self.timings[stage.name] = 0.0
+                self.results[stage.name] = result
+                self.restored.append(stage.name)
+                print(f"\n♻️ Stage '{stage.name}' restored from checkpoint")
+                report(stage.name, "restored", 100.0, overall=self._overall())
+                return result
+            await run_blocking(manifest.start, stage.name, inputs)
+
+        started = time.monotonic()
+        print(f"\n▶️ Stage '{stage.name}' started")
+        report(stage.name, "started", 0.0, overall=self._overall())
+        try:
+            result = await stage.func(**inputs)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            report(stage.name, "failed", seconds=round(time.monotonic() - started, 2), error=str(e))
+            if manifest is not None:
+                await run_blocking(manifest.fail, stage.name, e)
+            raise StageError(stage.name, e) from e
+        self.timings[stage.name] = time.monotonic() - started
+        self.results[stage.name] = result
+        report(stage.name, "completed", 100.0, seconds=round(self.timings[stage.name], 2), overall=self._overall())
+        if manifest is not None:
+            try:
+                await run_blocking(manifest.complete, stage.name, inputs, result, self.timings[stage.name])
+            except Exception as e:
+                print(f"⚠️ Could not checkpoint stage '{stage.name}': {str(e)}")
+        print(f"⏱️ Stage '{stage.name}' finished in {self.timings[stage.name]:.1f}s")
+        return result
+
+    def _overall(self) -> float:
+        """Share of the stages that have finished, in percent."""
+        return round(len(self.results) / len(self.stages) * 100, 1) if self.stages else 100.0
+
+    async def run(self) -> Dict[str, Any]:
+        """Run every stage and return a dict of results keyed by stage name.
+
+        Raises:
+            StageError: For the first stage that fails. All other stages are cancelled.
+        """
+        tasks: Dict[str, asyncio.Task] = {}
+        for name in self.order:
+            tasks[name] = asyncio.create_task(self._run_stage(self.stages[name], tasks))
+
+        started = time.monotonic()
+        try:
+            done, pending = await asyncio.wait(tasks.values(), return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                if not task.cancelled() and task.exception() is not None:
+                    raise task.exception()
+        finally:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+        print(f"\n⏱️ Pipeline finished in {time.monotonic() - started:.1f}s")
+        return dict(self.results)
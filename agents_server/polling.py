@@ -0,0 +1,150 @@
+import asyncio
+import inspect
+import os
+import random
+from typing import Any, Callable, Optional
+
+from agents_server.concurrency import run_blocking
+
+# Relative jitter applied to every wait, so tasks started together do not poll in lockstep
+POLL_JITTER = float(os.getenv("POLL_JITTER", "0.2"))
+# Consecutive failed status checks tolerated before giving up
+POLL_MAX_ERRORS = int(os.getenv("POLL_MAX_ERRORS", "3"))
+# Fallback polling interval while a completion webhook is expected
+POLL_WEBHOOK_INTERVAL = float(os.getenv("POLL_WEBHOOK_INTERVAL", "30"))
+
+
+class PollSchedule:
+    """When to check a long-running task.
+
+    Nothing is checked during initial_delay, which should be a little less than the
+    provider's fastest typical completion. Checks then start every interval seconds
+    and back off by factor up to max_interval. The task is abandoned after deadline
+    seconds.
+    """
+
+    def __init__(
+        self,
+        initial_delay: float,
+        interval: float,
+        max_interval: float,
+        factor: float = 1.5,
+        deadline: float = 1800
+    ):
+        self.initial_delay = initial_delay
+        self.interval = interval
+        self.max_interval = max_interval
+        self.factor = factor
+        self.deadline = deadline
+
+    def delays(self):
+        """Yield the successive waits, before jitter."""
+        yield self.initial_delay
+        interval = self.interval
+        while True:
+            yield interval
+            interval = min(interval * self.factor, self.max_interval)
+
+
+# Tuned to each provider's typical completion time, override the deadline with e.g. RUNWAY_POLL_TIMEOUT=1200
+POLL_SCHEDULES = {
+    # Short avatar clips usually render in one to three minutes
+    "heygen": PollSchedule(
+        initial_delay=20, interval=3, max_interval=15,
+        deadline=float(os.getenv("HEYGEN_POLL_TIMEOUT", "1800"))
+    ),
+    # gen4_turbo clips usually finish in 30-60 seconds
+    "runway": PollSchedule(
+        initial_delay=15, interval=2, max_interval=10, factor=1.4,
+        deadline=float(os.getenv("RUNWAY_POLL_TIMEOUT", "900"))
+    ),
+    # Captioning a short video takes well under a minute
+    "zapcap": PollSchedule(
+        initial_delay=5, interval=2, max_interval=10,
+        deadline=float(os.getenv("ZAPCAP_POLL_TIMEOUT", "900"))
+    ),
+}
+
+
+class PollTimeout(Exception):
+    pass
+
+
+def _jittered(delay: float) -> float:
+    return max(0.0, delay * random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER))
+
+
+async def poll_until(
+    provider: str,
+    check: Callable[[], Any],
+    is_done: Callable[[Any], bool],
+    task_id: str = "",
+    schedule: Optional[PollSchedule] = None,
+    wake: Optional[asyncio.Future] = None
+) -> Any:
+    """Check a provider task on its schedule until it reaches a final state.
+
+    Waiting costs no thread, so any number of tasks can be tracked at once.
+    Blocking check functions run on the shared executor. When a wake future is
+    given (see webhooks.expect), the status is checked as soon as it resolves and
+    polling slows down to POLL_WEBHOOK_INTERVAL as a fallback.
+
+    Args:
+        provider (str): Key of POLL_SCHEDULES, also used in log lines
+        check (callable): Returns the current task status, sync or async
+        is_done (callable): True when a status is final (succeeded or failed)
+        task_id (str): Task identifier for log lines
+        schedule (PollSchedule, optional): Overrides the provider schedule
+        wake (Future, optional): Resolved by a completion webhook
+
+    Returns:
+        The first status for which is_done returned True
+
+    Raises:
+        PollTimeout: If the task is not done before the schedule's deadline
+    """
+    schedule = schedule or POLL_SCHEDULES[provider]
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    deadline = started + schedule.deadline
+    checks = 0
+    errors = 0
+    woken = False
+
+    for delay in schedule.delays():
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        if wake is not None and not wake.done():
+            if checks:
+                delay = max(delay, POLL_WEBHOOK_INTERVAL)
+            await asyncio.wait({wake}, timeout=min(_jittered(delay), remaining))
+            if wake.done():
+                print(f"📬 {provider} webhook received for {task_id}")
+                woken = True
+        elif wake is not None and not woken:
+            # The webhook arrived before polling started, check right away
+            print(f"📬 {provider} webhook received for {task_id}")
+            woken = True
+        else:
+            await asyncio.sleep(min(_jittered(delay), remaining))
+
+        checks += 1
+        try:
+            if inspect.iscoroutinefunction(check):
+                status = await check()
+            else:
+                status = await run_blocking(check)
+            errors = 0
+        except Exception as e:
+            errors += 1
+            if errors > POLL_MAX_ERRORS:
+                raise
+            print(f"⚠️ {provider} status check for {task_id} failed ({errors}/{POLL_MAX_ERRORS}): {str(e)}")
+            continue
+
+        if is_done(status):
+            print(f"⏱️ {provider} task {task_id} finished after {loop.time() - started:.1f}s and {checks} status checks")
+            return status
+
+    raise PollTimeout(f"{provider} task {task_id} did not finish within {schedule.deadline:.0f}s ({checks} status checks)")
@@ -0,0 +1,152 @@
+import asyncio
+import contextvars
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+# Events kept per job for clients that connect late
+PROGRESS_HISTORY = int(os.getenv("PROGRESS_HISTORY", "500"))
+# Minimum seconds between two "progress" events of the same stage, start and end events always go out
+PROGRESS_MIN_INTERVAL = float(os.getenv("PROGRESS_MIN_INTERVAL", "0.5"))
+# Seconds of silence after which a subscriber gets a keep-alive, so proxies keep the stream open
+PROGRESS_KEEPALIVE = float(os.getenv("PROGRESS_KEEPALIVE", "15"))
+
+# Bus of the job the current task or thread works for, None outside of jobs
+_current_bus: contextvars.ContextVar[Optional["ProgressBus"]] = contextvars.ContextVar("progress_bus", default=None)
+
+
+class ProgressBus:
+    """Progress events of one job run, fanned out to any number of subscribers.
+
+    publish() may be called from the event loop or from worker threads (run_blocking
+    carries the context over), and is a few dict operations when nobody listens.
+    """
+
+    def __init__(self, job_id: str, history: int = PROGRESS_HISTORY, first_id: int = 1):
+        self.job_id = job_id
+        self.loop = asyncio.get_running_loop()
+        self.started = time.monotonic()
+        self.events: deque = deque(maxlen=history)
+        self.closed = False
+        self._next_id = first_id
+        self._subscribers: List[asyncio.Queue] = []
+        self._last_progress: Dict[str, float] = {}
+
+    @property
+    def last_id(self) -> int:
+        """Id of the latest event, 0 before the first one of a job."""
+        return self._next_id - 1
+
+    def publish(self, stage: str, status: str = "progress", percent: Optional[float] = None, **fields):
+        """Record an event for a stage.
+
+        Args:
+            stage (str): Stage name, e.g. "avatar" or "broll_2"
+            status (str): "started", "progress", "completed", "failed" or "restored"
+            percent (float, optional): Completion of the stage, 0-100
+            **fields: Extra JSON-serializable details, e.g. seconds or error
+        """
+        now = time.monotonic()
+        if status == "progress":
+            last = self._last_progress.get(stage)
+            if last is not None and now - last < PROGRESS_MIN_INTERVAL:
+                return
+            self._last_progress[stage] = now
+        event = {
+            "jobId": self.job_id,
+            "stage": stage,
+            "status": status,
+            "percent": round(percent, 1) if percent is not None else None,
+            "elapsed": round(now - self.started, 2),
+            "time": time.time(),
+            **fields,
+        }
+        self._on_loop(self._append, event)
+
+    def _on_loop(self, callback: Callable, *args):
+        try:
+            on_loop = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            callback(*args)
+        else:
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    def _append(self, event: Dict[str, Any]):
+        if self.closed:
+            return
+        event["id"] = self._next_id
+        self._next_id += 1
+        self.events.append(event)
+        for queue in self._subscribers:
+            queue.put_nowait(event)
+
+    def close(self):
+        """End the stream, subscribers stop after the events published so far."""
+        self._on_loop(self._finish)
+
+    def _finish(self):
+        self.closed = True
+        for queue in self._subscribers:
+            queue.put_nowait(None)
+
+    async def subscribe(
+        self,
+        after: int = 0,
+        keepalive: Optional[float] = PROGRESS_KEEPALIVE
+    ) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """Yield the stored events with an id above after, then new ones until the bus is closed.
+
+        None is yielded after keepalive seconds without events.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        for event in list(self.events):
+            if event["id"] > after:
+                queue.put_nowait(event)
+        if self.closed:
+            queue.put_nowait(None)
+        else:
+            self._subscribers.append(queue)
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if event is None:
+                    return
+                yield event
+        finally:
+            if queue in self._subscribers:
+                self._subscribers.remove(queue)
+
+
+def use_bus(bus: Optional[ProgressBus]) -> contextvars.Token:
+    """Make bus the target of report() in the current context. Returns a token for reset_bus."""
+    return _current_bus.set(bus)
+
+
+def reset_bus(token: contextvars.Token):
+    _current_bus.reset(token)
+
+
+def report(stage: str, status: str = "progress", percent: Optional[float] = None, **fields):
+    """Publish a progress event for the job running in this context, a no-op outside of jobs."""
+    bus = _current_bus.get()
+    if bus is not None:
+        bus.publish(stage, status, percent, **fields)
+
+
+def ffmpeg_reporter(stage: str) -> Optional[Callable[[Dict[str, Any]], None]]:
+    """on_progress callback for run_media that reports ffmpeg's percentage, or None outside of jobs."""
+    if _current_bus.get() is None:
+        return None
+
+    def on_progress(snapshot: Dict[str, Any]):
+        if snapshot.get("percent") is not None:
+            report(stage, percent=snapshot["percent"], speed=snapshot.get("speed"))
+
+    return on_progress
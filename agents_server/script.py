@@ -1,10 +1,11 @@
 import asyncio
 import os
 from typing import Dict, Any
-from openai import AsyncOpenAI
-from agents import Agent, OpenAIChatCompletionsModel, Runner, function_tool, set_tracing_disabled, trace, WebSearchTool
+from agents import Agent, OpenAIChatCompletionsModel, Runner, function_tool, set_default_openai_client, set_tracing_disabled, trace, WebSearchTool
 from dotenv import load_dotenv
 from pydantic import BaseModel
+from agents_server.clients import get_async_openai_client
+from agents_server.llm_cache import cached_call_async
 
 load_dotenv()
 
@@ -16,10 +17,40 @@ if not OPENAI_API_KEY:
     raise ValueError("Please set OPENAI_API_KEY in your environment variables.")
 
 # Create separate clients for Perplexity and OpenAI
-openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+openai_client = get_async_openai_client()
+set_default_openai_client(openai_client)
 set_tracing_disabled(disabled=True)
 
 
+async def run_agent(cache_name: str, agent: Agent, prompt: str, key_prompt: str = None):
+    """Run an agent through the LLM cache and return its final output.
+
+    Args:
+        cache_name (str): Cache namespace, used for LLM_CACHE_SKIP and TTL overrides
+        agent (Agent): Agent to run
+        prompt (str): Input for the agent
+        key_prompt (str, optional): Text to key the cache on instead of the prompt
+
+    Returns:
+        The agent's final output
+    """
+    async def run():
+        result = await Runner.run(agent, prompt)
+        return result.final_output
+
+    return await cached_call_async(
+        cache_name,
+        str(agent.model),
+        {
+            "instructions": agent.instructions,
+            "tools": [tool.name for tool in agent.tools],
+            "input": key_prompt or prompt,
+        },
+        run,
+        schema=agent.output_type
+    )
+
+
 class ScriptCheckerOutput(BaseModel):
     good_quality: bool
     feedback: str
@@ -134,9 +165,15 @@ class GenerateScript:
                 Your response should be in full sentences explaining the insights in details
             """
 
-            market_research_result = await Runner.run(
+            # Market research does not depend on the script language, so one result serves every language
+            research_key = "\n".join(
+                line for line in research_prompt.splitlines() if not line.strip().startswith("- Language:")
+            )
+            market_research = await run_agent(
+                "research",
                 ResearchAgent().agent,
-                research_prompt
+                research_prompt,
+                key_prompt=research_key
             )
 
             outline_prompt = f"""
@@ -150,29 +187,31 @@ class GenerateScript:
                 - Target Audience: {self.info['audience']}
                 
                 You are provided with the market research insights:
-                {market_research_result.final_output}
+                {market_research}
 
                 Please generate a full marketing script outline that clearly describes the flow of the marketing pitch.
                 Your response should only be an outline, not a full script. If you think the outline is not good, please provide feedback.
             """
 
             # 2. Generate The Outline
-            script_outline = await Runner.run(
+            script_outline = await run_agent(
+                "outline",
                 OutlineGeneratorAgent(self.info).agent,
                 outline_prompt
             )
 
-            script_outline_checker = await Runner.run(
+            script_outline_checker = await run_agent(
+                "evaluator",
                 EvaluatorAgent(self.info).agent,
-                script_outline.final_output
+                script_outline
             )
 
             # 3. Evaluate the Outline
-            # if not script_outline_checker.final_output.good_quality:
+            # if not script_outline_checker.good_quality:
             #     print("No Bueno")
             #     exit(0)
 
-            print(script_outline_checker.final_output.good_quality)
+            print(script_outline_checker.good_quality)
             
             generation_prompt = f"""
                 You are a PhD in marketing and expert in generating short marketing video scripts
@@ -185,10 +224,10 @@ class GenerateScript:
                 - Target Audience: {self.info['audience']}
                 
                 You are also given the following market research insights:
-                {market_research_result.final_output}
+                {market_research}
                 
                 You are also given the following script outline:
-                {script_outline.final_output}
+                {script_outline}
 
                 **Important:**  
                 - Write only the lines the speaker would say — no descriptions, no labels, no explanation and no titles for each section.
@@ -197,12 +236,13 @@ class GenerateScript:
                 - Make sure that the duration of the script is around 30 seconds.    
             """
             # 4. Generate the Script
-            script = await Runner.run(
+            script = await run_agent(
+                "script",
                 GeneratorAgent(self.info).agent,
                 generation_prompt
             )
 
-            return script.final_output
+            return script
 
 async def main():
     # Example usage
@@ -0,0 +1,123 @@
+import asyncio
+import hmac
+import os
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+
+# Public base URL of this server, e.g. https://api.example.com. Webhooks are only used when it is set.
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "").rstrip("/")
+# Shared secret providers must send as ?token= or an X-Webhook-Token header
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# Webhooks that arrive before their task is registered are kept for a short while
+WEBHOOK_EARLY_LIMIT = int(os.getenv("WEBHOOK_EARLY_LIMIT", "1000"))
+
+# Providers that accept a per-task callback URL. Runway and ZapCap have none and are polled.
+WEBHOOK_PROVIDERS = ("heygen",)
+
+_waiters: Dict[Tuple[str, str], Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = {}
+_early: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+
+
+def webhooks_enabled() -> bool:
+    return bool(WEBHOOK_BASE_URL)
+
+
+def callback_url(provider: str) -> Optional[str]:
+    """URL the provider should call when a task finishes, or None if webhooks are off."""
+    if not webhooks_enabled():
+        return None
+    url = f"{WEBHOOK_BASE_URL}/api/webhooks/{provider}"
+    return f"{url}?token={WEBHOOK_SECRET}" if WEBHOOK_SECRET else url
+
+
+def verify_token(token: Optional[str]) -> bool:
+    if not WEBHOOK_SECRET:
+        return True
+    return hmac.compare_digest(token or "", WEBHOOK_SECRET)
+
+
+def expect(provider: str, task_id: str) -> Optional[asyncio.Future]:
+    """Register interest in a task's completion webhook.
+
+    Returns a future that is resolved with the webhook payload, or None when
+    webhooks are off. Pass it to poll_until as wake, then call forget() once
+    the task is finished.
+    """
+    if not webhooks_enabled():
+        return None
+    loop = asyncio.get_running_loop()
+    key = (provider, str(task_id))
+    future = loop.create_future()
+    _waiters[key] = (loop, future)
+    payload = _early.pop(key, None)
+    if payload is not None:
+        future.set_result(payload)
+    return future
+
+
+def forget(provider: str, task_id: str):
+    entry = _waiters.pop((provider, str(task_id)), None)
+    if entry and not entry[1].done():
+        entry[0].call_soon_threadsafe(entry[1].cancel)
+
+
+def resolve(provider: str, task_id: str, payload: Dict[str, Any]) -> bool:
+    """Wake the task waiting on this webhook. Returns False if nothing was waiting yet."""
+    key = (provider, str(task_id))
+    entry = _waiters.get(key)
+    if entry is None:
+        _early[key] = payload
+        while len(_early) > WEBHOOK_EARLY_LIMIT:
+            _early.popitem(last=False)
+        return False
+    loop, future = entry
+
+    def wake():
+        if not future.done():
+            future.set_result(payload)
+
+    loop.call_soon_threadsafe(wake)
+    return True
+
+
+def task_id_from_payload(provider: str, payload: Dict[str, Any]) -> Optional[str]:
+    """Find the task id in a provider's webhook body."""
+    if provider == "heygen":
+        # {"event_type": "avatar_video.success", "event_data": {"video_id": ...}}
+        event_data = payload.get("event_data") or {}
+        return event_data.get("video_id") or payload.get("video_id")
+    return None
+
+
+router = APIRouter()
+
+
+@router.post("/api/webhooks/{provider}")
+async def provider_webhook(provider: str, request: Request):
+    if provider not in WEBHOOK_PROVIDERS:
+        return JSONResponse(
+            status_code=404,
+            content={"status": False, "error": f"Unknown provider: {provider}"},
+        )
+    token = request.query_params.get("token") or request.headers.get("X-Webhook-Token")
+    if not verify_token(token):
+        return JSONResponse(status_code=401, content={"status": False, "error": "Invalid token"})
+
+    try:
+        payload = await request.json()
+    except Exception:
+        payload = None
+    if not isinstance(payload, dict):
+        return JSONResponse(status_code=400, content={"status": False, "error": "Invalid JSON body"})
+
+    task_id = task_id_from_payload(provider, payload)
+    if not task_id:
+        return JSONResponse(status_code=400, content={"status": False, "error": "No task id in payload"})
+
+    # The waiting task re-checks the status itself, the payload only wakes it up
+    matched = resolve(provider, task_id, payload)
+    print(f"📬 {provider} webhook for {task_id} ({'matched' if matched else 'no waiter yet'})")
+    return {"status": True, "matched": matched}
@@ -1,10 +1,13 @@
+import asyncio
 import os
-import time
 import json
-import requests
 from typing import Optional, Dict, Any
 from pathlib import Path
 from dotenv import load_dotenv
+from agents_server.clients import get_http_session
+from agents_server.concurrency import run_blocking
+from agents_server.downloads import download_file
+from agents_server.polling import poll_until
 
 load_dotenv()
 
@@ -13,71 +16,74 @@ class ZapCapCaptionGenerator:
         self.api_key = os.getenv('ZAPCAP_API_KEY')
         if not self.api_key:
             raise ValueError('ZAPCAP_API_KEY not found in environment variables')
-        self.api_base = 'https://api.zapcap.ai'
+        self.api_base = os.getenv('ZAPCAP_API_BASE', 'https://api.zapcap.ai').rstrip('/')
+        self.session = get_http_session()
     
-    def add_captions(self, video_path, template_id, output_path):
+    def _upload(self, video_path):
+        with open(video_path, 'rb') as f:
+            upload_response = self.session.post(
+                f'{self.api_base}/videos',
+                headers={'x-api-key': self.api_key},
+                files={'file': f}
+            )
+        upload_response.raise_for_status()
+        return upload_response.json()['id']
+
+    def _create_task(self, video_id, template_id):
+        task_response = self.session.post(
+            f'{self.api_base}/videos/{video_id}/task',
+            headers={
+                'x-api-key': self.api_key,
+                'Content-Type': 'application/json'
+            },
+            json={
+                'templateId': template_id,
+                'autoApprove': True,
+                'language': 'en'
+            }
+        )
+        task_response.raise_for_status()
+        return task_response.json()['taskId']
+
+    def _check_task_status(self, video_id, task_id):
+        status_response = self.session.get(
+            f'{self.api_base}/videos/{video_id}/task/{task_id}',
+            headers={'x-api-key': self.api_key}
+        )
+        status_response.raise_for_status()
+        return status_response.json()
+
+    async def add_captions(self, video_path, template_id, output_path):
         try:
             # Upload video
             print('Uploading video...')
-            with open(video_path, 'rb') as f:
-                upload_response = requests.post(
-                    f'{self.api_base}/videos',
-                    headers={'x-api-key': self.api_key},
-                    files={'file': f}
-                )
-                upload_response.raise_for_status()
-                video_id = upload_response.json()['id']
-                print('Video uploaded, ID:', video_id)
+            video_id = await run_blocking(self._upload, video_path)
+            print('Video uploaded, ID:', video_id)
 
-                # Create task
-                print('Creating task...')
-                task_response = requests.post(
-                    f'{self.api_base}/videos/{video_id}/task',
-                    headers={
-                        'x-api-key': self.api_key,
-                        'Content-Type': 'application/json'
-                    },
-                    json={
-                        'templateId': template_id,
-                        'autoApprove': True,
-                        'language': 'en'
-                    }
-                )
-                task_response.raise_for_status()
-                task_id = task_response.json()['taskId']
-                print('Task created, ID:', task_id)
-                
-                # Poll for task completion
-                print('Waiting for task to complete...')
-                attempts = 0
-                while True:
-                    status_response = requests.get(
-                        f'{self.api_base}/videos/{video_id}/task/{task_id}',
-                        headers={'x-api-key': self.api_key}
-                    )
-                    status_response.raise_for_status()
-                    data = status_response.json()
-                    status = data['status']
-                    
-                    if status == 'completed':
-                        # Download video
-                        print('Task completed, downloading video...')
-                        download_response = requests.get(data['downloadUrl'])
-                        download_response.raise_for_status()
+            # Create task
+            print('Creating task...')
+            task_id = await run_blocking(self._create_task, video_id, template_id)
+            print('Task created, ID:', task_id)
+
+            # Poll for task completion
+            print('Waiting for task to complete...')
+            data = await poll_until(
+                'zapcap',
+                lambda: self._check_task_status(video_id, task_id),
+                lambda data: data['status'] in ('completed', 'failed'),
+                task_id=task_id
+            )
+            if data['status'] == 'failed':
+                raise Exception(f"Task failed: {data.get('error')}")
+
+            # Download video
+            print('Task completed, downloading video...')
+            await run_blocking(download_file, data['downloadUrl'], output_path, session=self.session)
+            print('Video downloaded, saved to:', output_path)
 
-                        with open(output_path, 'wb') as f:
-                            f.write(download_response.content)
-                        print('Video downloaded, saved to:', output_path)
-                        break
-                    
-                    elif status == 'failed':
-                        raise Exception(f"Task failed: {data.get['error']}")
-                    
-                    time.sleep(2)
-                    attempts += 1
-                    
         except Exception as e:
             print(f"Error adding captions: {str(e)}")
+            raise
 
 if __name__ == '__main__':
     video_path = './output/test_merge.mp4'
@@ -85,7 +91,7 @@ if __name__ == '__main__':
     output_path = 'captioned.mp4'
     
     caption_generator = ZapCapCaptionGenerator()
-    caption_generator.add_captions(video_path, template_id, output_path)
+    asyncio.run(caption_generator.add_captions(video_path, template_id, output_path))
                     
                     
                 
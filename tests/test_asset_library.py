@@ -0,0 +1,58 @@
+import json
+import os
+
+from agents_server.broll_generation import asset_library
+from agents_server.broll_generation.asset_library import AssetLibrary
+
+
+def _clip(tmp_path, name, size=100):
+    path = tmp_path / name
+    path.write_bytes(b"x" * size)
+    return str(path)
+
+
+def _index(directory):
+    with open(os.path.join(directory, "index.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_libraries_sharing_a_directory_keep_each_others_assets(tmp_path):
+    directory = str(tmp_path / "library")
+    first = AssetLibrary(directory)
+    second = AssetLibrary(directory)
+    first.add("red shoe on a desk", "slow zoom in", b"image", _clip(tmp_path, "a.mp4"), 10)
+    second.add("blue cup in a kitchen", "pan left", b"image", _clip(tmp_path, "b.mp4"), 12)
+
+    assert len(_index(directory)) == 2
+    assert first.find("blue cup in a kitchen", "pan left")["static_prompt"] == "blue cup in a kitchen"
+    assert second.find("red shoe on a desk", "slow zoom in")["static_prompt"] == "red shoe on a desk"
+
+
+def test_missing_clip_falls_back_to_next_candidate_and_is_dropped(tmp_path):
+    directory = str(tmp_path / "library")
+    library = AssetLibrary(directory, threshold=0.5)
+    gone = library.add("red shoe on a wooden desk", "slow zoom in", b"image", _clip(tmp_path, "a.mp4"), 10)
+    kept = library.add("red shoe on a desk", "slow zoom in", b"image", _clip(tmp_path, "b.mp4"), 10)
+    os.remove(gone["video_path"])
+
+    found = library.find("red shoe on a wooden desk", "slow zoom in")
+
+    assert found["id"] == kept["id"]
+    assert [entry["id"] for entry in _index(directory)] == [kept["id"]]
+    assert not os.path.exists(gone["image_path"])
+
+
+def test_least_used_assets_are_evicted_beyond_max_bytes(tmp_path, monkeypatch):
+    monkeypatch.setattr(asset_library, "USES_FLUSH_EVERY", 1)
+    directory = str(tmp_path / "library")
+    library = AssetLibrary(directory, max_bytes=250)
+    used = library.add("red shoe on a desk", "slow zoom in", b"", _clip(tmp_path, "a.mp4"), 10)
+    unused = library.add("blue cup in a kitchen", "pan left", b"", _clip(tmp_path, "b.mp4"), 10)
+    assert library.find("red shoe on a desk", "slow zoom in")["id"] == used["id"]
+
+    newest = library.add("green plant by a window", "tilt up", b"", _clip(tmp_path, "c.mp4"), 10)
+
+    ids = [entry["id"] for entry in _index(directory)]
+    assert ids == [used["id"], newest["id"]]
+    assert not os.path.exists(unused["video_path"])
+    assert library.report()["evicted"] == 1
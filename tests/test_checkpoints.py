@@ -0,0 +1,67 @@
+import os
+from typing import Optional
+
+from pydantic import BaseModel
+
+from agents_server.checkpoints import JobManifest, read_manifest
+
+PAYLOAD = {"productName": "Desk Lamp", "language": "English"}
+
+
+class Scene(BaseModel):
+    description: str
+    video_path: Optional[str] = None
+
+
+def _artifact(tmp_path, name="scene.mp4"):
+    path = tmp_path / name
+    path.write_bytes(b"video")
+    return str(path)
+
+
+def test_pydantic_result_round_trips_through_the_manifest(tmp_path):
+    video = _artifact(tmp_path)
+    result = {"scenes": [Scene(description="lamp turning on", video_path=video)], "seconds": 4.5}
+    JobManifest(str(tmp_path), "job", PAYLOAD).complete("broll", {"count": 1}, result, 12.3)
+
+    restored, value = JobManifest(str(tmp_path), "job", PAYLOAD).restore("broll", {"count": 1})
+
+    assert restored
+    assert value == result
+    assert isinstance(value["scenes"][0], Scene)
+    assert read_manifest(str(tmp_path))["stages"]["broll"]["artifacts"] == [video]
+
+
+def test_restore_misses_when_inputs_change(tmp_path):
+    manifest = JobManifest(str(tmp_path), "job", PAYLOAD)
+    manifest.complete("script", {"tone": "calm"}, "Meet the lamp.", 1.0)
+
+    assert manifest.restore("script", {"tone": "calm"}) == (True, "Meet the lamp.")
+    assert manifest.restore("script", {"tone": "loud"}) == (False, None)
+
+
+def test_restore_misses_when_an_artifact_is_deleted(tmp_path):
+    video = _artifact(tmp_path)
+    manifest = JobManifest(str(tmp_path), "job", PAYLOAD)
+    manifest.complete("avatar", {}, video, 30.0)
+    os.remove(video)
+
+    assert manifest.restore("avatar", {}) == (False, None)
+
+
+def test_restore_misses_for_unfinished_stages(tmp_path):
+    manifest = JobManifest(str(tmp_path), "job", PAYLOAD)
+    manifest.start("merge", {})
+    manifest.fail("merge", RuntimeError("ffmpeg exited with 1"))
+
+    assert manifest.restore("merge", {}) == (False, None)
+    assert read_manifest(str(tmp_path))["stages"]["merge"]["error"] == "ffmpeg exited with 1"
+
+
+def test_different_payload_resets_the_manifest(tmp_path):
+    JobManifest(str(tmp_path), "job", PAYLOAD).complete("script", {}, "Meet the lamp.", 1.0)
+
+    manifest = JobManifest(str(tmp_path), "job", dict(PAYLOAD, productName="Desk Fan"))
+
+    assert manifest.restore("script", {}) == (False, None)
+    assert read_manifest(str(tmp_path))["stages"] == {}
@@ -0,0 +1,82 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from agents_server import downloads
+from agents_server.downloads import DownloadError, download_file
+
+BODY = bytes(range(256)) * 64
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serves BODY with range support. The server's mode makes it misbehave."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(BODY)))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+
+    def do_GET(self):
+        first, _, last = self.headers["Range"][len("bytes="):].partition("-")
+        first, last = int(first), int(last) if last else len(BODY) - 1
+        mode = self.server.mode
+        self.server.requests += 1
+        if mode == "shifted":
+            first, last = first + 1, min(last + 1, len(BODY) - 1)
+        data = BODY[first:last + 1]
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {first}-{last}/{len(BODY)}")
+        if mode == "short" and self.server.requests <= 2:
+            # Cut the body in half without announcing a length
+            data = data[:len(data) // 2]
+        else:
+            self.send_header("Content-Length", str(len(data)))
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    httpd.mode = "normal"
+    httpd.requests = 0
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture(autouse=True)
+def parallel_parts(monkeypatch):
+    monkeypatch.setattr(downloads, "DOWNLOAD_PARALLEL_THRESHOLD", 1024)
+    monkeypatch.setattr(downloads, "DOWNLOAD_PARTS", 4)
+    monkeypatch.setattr(downloads.time, "sleep", lambda seconds: None)
+
+
+def _url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}/clip.mp4"
+
+
+def test_parallel_download_assembles_the_file(server, tmp_path):
+    path = download_file(_url(server), str(tmp_path / "clip.mp4"))
+    assert open(path, "rb").read() == BODY
+
+
+def test_short_parts_are_resumed(server, tmp_path):
+    server.mode = "short"
+    path = download_file(_url(server), str(tmp_path / "clip.mp4"))
+    assert open(path, "rb").read() == BODY
+
+
+def test_range_at_wrong_offset_is_rejected(server, tmp_path):
+    server.mode = "shifted"
+    with pytest.raises(DownloadError, match="Content-Range"):
+        download_file(_url(server), str(tmp_path / "clip.mp4"))
+    assert not (tmp_path / "clip.mp4.part").exists()
@@ -0,0 +1,75 @@
+import asyncio
+
+from agents_server.jobs import JobManager, idempotency_key
+
+PAYLOAD = {"productName": "Desk Lamp", "features": ["warm  light", "USB-C"], "language": "English"}
+
+
+def test_normalized_payloads_share_a_key():
+    reordered = {"language": "English", "features": [" warm light ", "USB-C"], "productName": "Desk\tLamp"}
+
+    assert idempotency_key(PAYLOAD) == idempotency_key(reordered)
+    assert idempotency_key(PAYLOAD) != idempotency_key(dict(PAYLOAD, productName="Desk Fan"))
+    assert idempotency_key(PAYLOAD, header=" order-42 ") == "header:order-42"
+
+
+async def _wait_until_done(job, timeout=5):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not job.done:
+        assert asyncio.get_running_loop().time() < deadline, f"job still {job.status}"
+        await asyncio.sleep(0.01)
+
+
+def test_duplicate_joins_queued_job():
+    async def scenario():
+        async def handler(payload, job_id):
+            return {"status": True}
+
+        # Workers are not started, so the first job stays queued
+        manager = JobManager(handler)
+        key = idempotency_key(PAYLOAD)
+        job, duplicate = manager.submit_once(PAYLOAD, key)
+        repeat, repeat_duplicate = manager.submit_once(dict(PAYLOAD), key)
+        return job, duplicate, repeat, repeat_duplicate, manager.queue.qsize()
+
+    job, duplicate, repeat, repeat_duplicate, queued = asyncio.run(scenario())
+
+    assert not duplicate
+    assert repeat is job and repeat_duplicate
+    assert job.status == "queued" and queued == 1
+
+
+def test_duplicate_of_failed_job_retries_it():
+    async def scenario():
+        calls = []
+
+        async def handler(payload, job_id):
+            calls.append(job_id)
+            if len(calls) == 1:
+                return {"status": False, "error": "HeyGen render failed"}
+            return {"status": True, "videoUrl": "https://example.com/video.mp4"}
+
+        manager = JobManager(handler, workers=1)
+        await manager.start()
+        try:
+            key = idempotency_key(PAYLOAD)
+            job, _ = manager.submit_once(PAYLOAD, key)
+            await _wait_until_done(job)
+            assert job.status == "failed" and job.error == "HeyGen render failed"
+
+            repeat, duplicate = manager.submit_once(PAYLOAD, key)
+            assert repeat is job and duplicate
+            await _wait_until_done(job)
+
+            # A completed job is never run again
+            assert manager.submit_once(PAYLOAD, key) == (job, True)
+            assert manager.retry(job.id) is job
+            return job, calls
+        finally:
+            await manager.stop()
+
+    job, calls = asyncio.run(scenario())
+
+    assert job.status == "completed" and job.attempts == 2
+    assert job.result["videoUrl"] == "https://example.com/video.mp4"
+    assert calls == [job.id, job.id]
@@ -0,0 +1,111 @@
+import asyncio
+import socket
+import threading
+import time
+import uuid
+
+import httpx
+import pytest
+import uvicorn
+from fastapi import FastAPI
+
+from agents_server import fake_providers, webhooks
+from agents_server.heygen import HeyGenVideoGenerator
+from agents_server.polling import POLL_SCHEDULES, PollSchedule, poll_until
+
+# Long enough that a task only finishes in time if a webhook wakes it
+SLOW_SCHEDULE = PollSchedule(initial_delay=60, interval=60, max_interval=60, deadline=120)
+
+
+def _serve(app):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError("Test server did not start")
+        time.sleep(0.05)
+    return server, thread, f"http://127.0.0.1:{port}"
+
+
+@pytest.fixture(scope="module")
+def servers():
+    """The fake providers and an app serving only the webhook endpoint."""
+    webhook_app = FastAPI()
+    webhook_app.include_router(webhooks.router)
+    running = [_serve(fake_providers.app), _serve(webhook_app)]
+    yield running[0][2], running[1][2]
+    for server, thread, _ in running:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+
+@pytest.fixture
+def webhook_base(servers, monkeypatch):
+    monkeypatch.setattr(webhooks, "WEBHOOK_BASE_URL", servers[1])
+    monkeypatch.setattr(webhooks, "WEBHOOK_SECRET", "")
+    return servers[1]
+
+
+def test_heygen_webhook_wakes_pending_poll(servers, webhook_base, monkeypatch):
+    monkeypatch.setattr(fake_providers, "FAKE_RENDER_SECONDS", 0.5)
+    monkeypatch.setenv("HEYGEN_API_KEY", "test")
+    monkeypatch.setenv("HEYGEN_API_BASE", servers[0])
+    monkeypatch.setitem(POLL_SCHEDULES, "heygen", SLOW_SCHEDULE)
+
+    generator = HeyGenVideoGenerator()
+    checks = []
+    check_video_status = generator._check_video_status
+
+    def counting_check(video_id):
+        checks.append(video_id)
+        return check_video_status(video_id)
+
+    generator._check_video_status = counting_check
+
+    started = time.monotonic()
+    result = asyncio.run(generator.generate_video(avatar_id="avatar", input_text="Hello there."))
+
+    assert result["success"], result
+    assert result["video_url"].endswith("/media/avatar.mp4")
+    # Without the webhook the first status check would only happen after the initial delay
+    assert time.monotonic() - started < 10
+    assert checks == [result["video_id"]]
+
+
+def test_early_webhook_is_consumed(webhook_base):
+    task_id = uuid.uuid4().hex
+    response = httpx.post(
+        f"{webhook_base}/api/webhooks/heygen",
+        json={"event_type": "avatar_video.success", "event_data": {"video_id": task_id}},
+    )
+    assert response.json() == {"status": True, "matched": False}
+
+    async def wait_for_task():
+        wake = webhooks.expect("heygen", task_id)
+        assert wake is not None and wake.done()
+        try:
+            return await poll_until(
+                "heygen",
+                lambda: {"status": "completed"},
+                lambda status: status["status"] == "completed",
+                task_id=task_id,
+                schedule=SLOW_SCHEDULE,
+                wake=wake
+            )
+        finally:
+            webhooks.forget("heygen", task_id)
+
+    started = time.monotonic()
+    assert asyncio.run(wait_for_task()) == {"status": "completed"}
+    assert time.monotonic() - started < 5
+    assert ("heygen", task_id) not in webhooks._early
+
+
+def test_webhook_for_unsupported_provider_is_rejected(webhook_base):
+    response = httpx.post(f"{webhook_base}/api/webhooks/runway", json={"id": "task"})
+    assert response.status_code == 404